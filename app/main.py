@@ -2,8 +2,12 @@ import logging
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
-from .routers import seller, customer, payments, catalog, ingredient, invoice, order
+from .routers import seller, customer, payments, catalog, ingredient, invoice, order, health
+from .settings.config import Config
+from .utils.ingredient_repository import ingredient_repository
+from .utils.square_gateway import square_gateway
 
 
 # logger
@@ -19,6 +23,7 @@ app = FastAPI(
     openapi_url="/openapi.json",
     docs_url="/",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
 )
 
 # CORS
@@ -37,4 +42,17 @@ app.include_router(catalog.router, prefix="/catalog", tags=["catalog"])
 app.include_router(ingredient.router, prefix="/ingredients", tags=["ingredients"])
 app.include_router(invoice.router, prefix="/invoice", tags=["invoice"])
 app.include_router(order.router, prefix="/order", tags=["order"])
+app.include_router(health.router, prefix="/health", tags=["health"])
 
+
+@app.on_event("startup")
+def warm_up_providers():
+    # Providers are created lazily, optionally warm them up without blocking the worker boot
+    Config.get_instance().warm_up_on_startup()
+
+
+
+@app.on_event("shutdown")
+async def close_pools():
+    await ingredient_repository.close()
+    await square_gateway.close()
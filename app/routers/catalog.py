@@ -1,13 +1,19 @@
 import uuid
-import os
 import json
+import hmac
+import base64
+import hashlib
 
 import logging
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Header
+import orjson
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Header, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import Optional, Annotated, Union
-import requests
 
 from ..settings.config import Config
+from ..utils.square_gateway import square_gateway, error_detail, json_response, SquareAPIError
+from ..utils.square_catalog import iter_catalog_objects, list_catalog, catalog_cache
+from ..utils.catalog_batch import batch_upsert_items, menu_items
 # from ..utils.square_payments import get_square_connection
 
 # logger
@@ -19,7 +25,7 @@ config = Config.get_instance()
 
 
 @router.post("/create")
-def create_catalog_object(access_token: Annotated[Union[str, None], Header()],  name: str = Form(...), price: int = Form(...)):
+async def create_catalog_object(access_token: Annotated[Union[str, None], Header()],  name: str = Form(...), price: int = Form(...)):
     """
     Create a new catalog object with price
     :param name:
@@ -60,12 +66,6 @@ def create_catalog_object(access_token: Annotated[Union[str, None], Header()],
     #         }
     #     }
     # )
-    url = "https://connect.squareupsandbox.com/v2/catalog/object"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer "+access_token,
-        "Content-Type": "application/json"
-    }
     data = {
         "idempotency_key": str(uuid.uuid4()),
         "object": {
@@ -96,19 +96,59 @@ def create_catalog_object(access_token: Annotated[Union[str, None], Header()],
         }
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = await square_gateway.post("/v2/catalog/object", access_token, json=data)
 
     if response.status_code == 200:
         logger.info(f"Created Catalog Object {name}")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in creating catalog Item -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        catalog_cache.invalidate(access_token)
+        return json_response(response)
+    else:
+        logger.error(f"Error in creating catalog Item -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
+
+
 
+@router.post("/batch_create")
+async def batch_create_catalog_objects(access_token: Annotated[Union[str, None], Header()],
+                                       items: Optional[str] = Form(None), menu: Optional[str] = Form(None),
+                                       currency: str = Form("CAD")):
+    """
+    Create many catalog objects with Square batch-upsert calls of up to 1000 objects
+    All prices of this endpoint are in currency units, e.g. 12.5 for 12.50 CAD, and are converted to Square amounts
+    :param items: JSON array of {name, price, category}
+    :param menu: Output of /seller/recommend_menu as JSON, courses become categories, unpriced dishes are not created
+                 and are listed in errors
+    :param currency:
+    :return: {items: [{name, category, catalog_object_id, variation_id}], errors: [{items, error}]}
+    """
+    try:
+        entries = json.loads(items) if items else []
+        if not isinstance(entries, list):
+            raise ValueError("items must be a JSON array")
+        unpriced = []
+        if menu:
+            dishes, unpriced = menu_items(json.loads(menu))
+            entries += dishes
+        if not entries:
+            raise ValueError("expected items or a menu with priced dishes")
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"Invalid catalog items --> {e}")
+
+    try:
+        result = await batch_upsert_items(access_token, entries, currency, config.catalog_batch_concurrency)
+    except (SquareAPIError, ValueError) as e:
+        logger.error(f"Error in creating catalog Items -->    {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    result['errors'] = unpriced + result['errors']
+    if not any(item['catalog_object_id'] for item in result['items']):
+        raise HTTPException(status_code=500, detail=str(result['errors']))
+    catalog_cache.invalidate(access_token)
+    logger.info(f"Created {len(result['items'])} Catalog Objects")
+    return result
 
 
 @router.post("/delete")
-def delete_catalog_object(access_token: Annotated[Union[str, None], Header()], catalog_object_id: list = Form(...)):
+async def delete_catalog_object(access_token: Annotated[Union[str, None], Header()], catalog_object_id: list = Form(...)):
     """
     Delete catalog object
     :param catalog_object_id:
@@ -127,65 +167,62 @@ def delete_catalog_object(access_token: Annotated[Union[str, None], Header()], c
     #
     # return result.body
 
-    url = f"https://connect.squareupsandbox.com/v2/catalog/object/{catalog_object_id}"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
-
-    response = requests.delete(url, headers=headers)
+    response = await square_gateway.delete(f"/v2/catalog/object/{catalog_object_id}", access_token)
 
     if response.status_code == 200:
         logger.info(f"Deleted Catalog Object {catalog_object_id}")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in deleting catalog Item -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        catalog_cache.invalidate(access_token)
+        return json_response(response)
+    else:
+        logger.error(f"Error in deleting catalog Item -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 
 
 @router.post("/list")
-def list_catalog_objects(access_token: Annotated[Union[str, None], Header()]):
+async def list_catalog_objects(access_token: Annotated[Union[str, None], Header()], stream: Optional[bool] = Form(False)):
     """
-    List catalog objects
-    :param types:
+    List catalog objects, following cursors through every page
+    :param stream: Stream objects as NDJSON, one catalog object per line, as pages arrive
     :return: Catalog Objects
     """
-    # square_client, square_location_id = get_square_connection(access_token)
-    #
-    # result = square_client.catalog.list_catalog(
-    #     types="ITEM"
-    # )
-    #
-    # if result.is_success():
-    #     logger.info(f"Listed Catalog Objects")
-    # elif result.is_error():
-    #     logger.error(f"Error in listing catalog Items -->    {result.errors}")
-    #     raise HTTPException(status_code=500, detail=str(result.errors))
-    #
-    # return result.body
-
-    url = "https://connect.squareupsandbox.com/v2/catalog/list?types=ITEM"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
-
-    response = requests.get(url, headers=headers)
-    print(response)
-
-    if response.status_code == 200:
-        logger.info(f"Listed Catalog Objects")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in listing catalog Items -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+    if not stream:
+        try:
+            catalog = await list_catalog(access_token)
+            logger.info(f"Listed Catalog Objects")
+            # Returned as a response so the large payload skips the generic encoder
+            return ORJSONResponse(catalog)
+        except SquareAPIError as e:
+            logger.error(f"Error in listing catalog Items -->    {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    objects = iter_catalog_objects(access_token)
+    # Read the first object before answering so that Square errors still map to an HTTP error
+    try:
+        first = await objects.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except SquareAPIError as e:
+        logger.error(f"Error in listing catalog Items -->    {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def ndjson():
+        if first is None:
+            return
+        yield orjson.dumps(first) + b"\n"
+        try:
+            async for catalog_object in objects:
+                yield orjson.dumps(catalog_object) + b"\n"
+            logger.info(f"Streamed Catalog Objects")
+        except SquareAPIError as e:
+            logger.error(f"Error in streaming catalog Items -->    {e}")
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 @router.post("/create/image")
-def create_catalog_image(access_token: Annotated[Union[str, None], Header()], catalog_object_id: str = Form(...), imageurl: str = Form(...), dishname: str = Form(...)):
+async def create_catalog_image(access_token: Annotated[Union[str, None], Header()], catalog_object_id: str = Form(...), imageurl: str = Form(...), dishname: str = Form(...)):
     """
     Create a catalog image
     :param catalog_object_id:
@@ -197,22 +234,14 @@ def create_catalog_image(access_token: Annotated[Union[str, None], Header()], ca
     #     raise HTTPException(status_code=400, detail="Only JPEG images are supported")
 
 
-    image = requests.get(imageurl)
+    image = await square_gateway.download(imageurl)
     if image.status_code != 200:
         raise HTTPException(status_code=400, detail="Image URL is not valid")
     else:
         logger.info(f"Image URL is valid")
-        temp_image_file = "temp_image"+str(uuid.uuid4())+".jpg"
-        with open(temp_image_file, 'wb') as f:
-            f.write(image.content)
         logger.info(f"Image downloaded")
 
 
-    url = "https://connect.squareupsandbox.com/v2/catalog/images"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token
-    }
     data = {
         "idempotency_key": str(uuid.uuid4()),
         "object_id": catalog_object_id,
@@ -229,18 +258,48 @@ def create_catalog_image(access_token: Annotated[Union[str, None], Header()], ca
 
     form_data = {
         'json': (None, json_data, 'application/json'),
-        'image': (None, open(temp_image_file, 'rb'), 'image/jpeg'),  # Adjust the content type as needed
+        'image': (None, image.content, 'image/jpeg'),  # Adjust the content type as needed
     }
 
-    response = requests.post(url, headers=headers,files=form_data)
-    #remove temp image file
-    os.remove(temp_image_file)
+    response = await square_gateway.post("/v2/catalog/images", access_token, files=form_data)
 
     if response.status_code == 200:
         logger.info(f"Created Catalog Image {catalog_object_id}")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in creating catalog Image -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        catalog_cache.invalidate(access_token)
+        return json_response(response)
+    else:
+        logger.error(f"Error in creating catalog Image -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
+
 
 
+
+@router.post("/webhook")
+async def catalog_webhook(request: Request):
+    """
+    Square webhook, invalidates the cached catalog of the merchant on catalog.version.updated
+    Disabled unless SQUARE_WEBHOOK_SIGNATURE_KEY is set, requests without a valid signature are rejected
+    :return: Number of invalidated catalogs
+    """
+    if not config.square_webhook_signature_key:
+        raise HTTPException(status_code=404, detail="Square webhook is not configured")
+    body = await request.body()
+    notification_url = config.square_webhook_url or str(request.url)
+    expected = base64.b64encode(hmac.new(config.square_webhook_signature_key.encode("utf-8"),
+                                         notification_url.encode("utf-8") + body, hashlib.sha256).digest())
+    signature = request.headers.get("x-square-hmacsha256-signature", "")
+    if not hmac.compare_digest(expected, signature.encode("utf-8")):
+        logger.error(f"Invalid Square webhook signature")
+        raise HTTPException(status_code=403, detail="Invalid Square webhook signature")
+
+    try:
+        event = json.loads(body)
+        if not isinstance(event, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid Square webhook body --> {e}")
+    if event.get("type") != "catalog.version.updated":
+        return {"invalidated": 0}
+    invalidated = catalog_cache.invalidate_merchant(event.get("merchant_id"))
+    logger.info(f"Catalog updated for merchant {event.get('merchant_id')}, invalidated {invalidated} cached catalogs")
+    return {"invalidated": invalidated}
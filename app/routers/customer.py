@@ -3,15 +3,24 @@ import time
 from fastapi import APIRouter
 import json
 import logging
-import requests
+import re
 
 from fastapi import Form, HTTPException, Header
-from typing import Annotated, Union
+from fastapi.responses import StreamingResponse
+from typing import Annotated, Optional, Union
 from langchain.prompts import PromptTemplate
 
 from ..settings.config import Config
+from ..utils.square_gateway import square_gateway, error_detail, json_response, SquareAPIError
+from ..utils.square_catalog import catalog_cache
 from ..utils.square_payments import get_square_connection
-from ..utils.clean import cleaned
+from ..utils.inventory_snapshot import inventory
+from ..utils.prompt_context import prompt_context
+from ..utils.llm_cache import llm_cache
+from ..utils.llm_executor import llm_executor
+from ..utils.chat_sessions import chat_sessions
+from ..utils.intent_router import intent_router
+from ..utils.structured_output import structured_output
 
 
 # logger
@@ -21,40 +30,28 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 config = Config.get_instance()
-conn = config.get_postgres_connection()
-llm = config.get_vertex_ai_connection()
-openai_llm = config.get_openai_text_connection()
-openai_llm_chat = config.get_openai_chat_connection()
 
 
 
 # Tools for Ingredients and Menu
-def read_from_postgres():
+async def read_from_postgres():
     """
     Used to Read from Postgres Table containing Ingredients
-    Read Ingredients from Postgres. Information is stored in a list of dictionaries. Each dictionary contains {name, quantity, unit, shelf_life_days, ingredient_type, ingredient_sub_type, unit_price}
-    :return: List of Ingredients containing {name, quantity, unit, shelf_life_days, ingredient_type, ingredient_sub_type}
+    Read Ingredients from the in-process inventory snapshot of Postgres. Each ingredient contains {name, quantity, unit, shelf_life_days, ingredient_type, ingredient_sub_type, unit_price}
+    :return: InventorySnapshot, ingredients are in snapshot.ingredients and already serialized to JSON bytes in snapshot.json
     """
     try:
-        ingredients = []
         logger.info(f"Reading from Postgres")
-        cur = conn.cursor()
-        cur.execute(""" SELECT * FROM "Ingredients" """)
-        rows = cur.fetchall()
-        logger.info(f"Read from Postgres")
-        for row in rows:
-            ingredient = {'name': row[2], 'quantity': row[6], 'unit': row[8], 'shelf_life_days': row[5],
-                          'ingredient_type': row[3], 'ingredient_sub_type': row[4], 'ingredient_id': row[0],
-                          'unitprice': row[7]}
-            ingredients.append(ingredient)
-        return ingredients
+        snapshot = await inventory.get()
+        logger.info(f"Read from inventory snapshot v{snapshot.version}")
+        return snapshot
     except Exception as e:
         logger.exception(f"An Exception Occurred while reading from Postgres --> {e}")
 
 
-def read_menu_from_square_catalog(access_token):
+async def read_menu_from_square_catalog(access_token):
     """
-    Used to Read Menu from Square Catalog
+    Used to Read Menu from Square Catalog, served from the in-memory catalog cache of the seller
     :return:
     """
 
@@ -69,77 +66,49 @@ def read_menu_from_square_catalog(access_token):
     # except Exception as e:
     #     logger.exception(f"An Exception Occurred while reading from Square --> {e}")
 
-    url = "https://connect.squareupsandbox.com/v2/catalog/list?types=ITEM"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
-
-    response = requests.get(url, headers=headers)
-
-    if response.status_code == 200:
-        logger.info(f"Read from Square")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in reading from Square -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+    try:
+        menu = await catalog_cache.get(access_token)
+        logger.info(f"Read Menu from Catalog cache")
+        return menu
+    except SquareAPIError as e:
+        logger.error(f"Error in reading from Square -->    {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 
-def summary(history):
+async def summary(history, previous_summary=""):
     """
     Summarize the history of chat
     :param history:
+    :param previous_summary: Summary of the conversation before history
     :return: summarized history
     """
     try:
         logger.info(f"Summarizing history of chat")
         template = """ 
         CONTEXT: You are a AI agent, who is going to read a conversation between a customer and a customer service agent. You need to summarize the conversation keeping all the important points from conversation intact in summary.
+        SUMMARY SO FAR: {previous_summary}
+        CONVERSATION: {history}
         TASK: Summarize the conversation between customer and customer service agent, while maintaining the context and important information of the conversation. 
         ANSWER: Just provide the summary of the conversation in Str Format. For example: "this is a summary of the conversation"
         """
         prompt = PromptTemplate.from_template(template)
+        llm = config.get_provider("vertex_ai")
         chain = prompt | llm
-        history_summary = {"Conversation Summary": chain.invoke(json.dumps(history))}
+        variables = {"previous_summary": previous_summary or "None", "history": json.dumps(history)}
+        history_summary = {"Conversation Summary": await llm_cache.ainvoke("chat_summary", "vertex_ai", chain, variables, llm)}
         logger.info(f"Summarized history of chat")
         return history_summary
     except Exception as e:
         logger.exception(f"An Exception Occurred while summarizing history of chat --> {e}")
 
 
-@router.post("/chat")
-def chat(access_token: Annotated[Union[str, None], Header()], message: str = Form(...), history: list = Form(...)):
-    """
-    This function will chat with Vertex AI
-    :param message:
-    :param history:
-    :return:
-    """
-    # use read_from_postgres() as a Agent tool to read Ingredients with Langchain
-    # tools = load_tools(tool_names, llm=llm)
-    if history is None:
-        history = []
-
-
-
-    # Chat with Vertex AI
-    # Need Buffer size check on history (Summarization may help)
-    # Use tools for Ingredients and Menu
-
-    ingredients = read_from_postgres()
-    menu = read_menu_from_square_catalog(access_token)
-
-    if "PAYMENT" in message or "Payment" in message or "payment" in message or "Pay" in message or "pay" in message:
-        return {"response": "Please pay for your order", "history": history, "stop": True, "payment": True}
+async def fold_history(history, previous_summary):
+    history_summary = await summary(history, previous_summary)
+    return history_summary["Conversation Summary"] if history_summary else None
 
-    if "STOP" in message or "Stop" in message or "stop" in message:
-        return {"response": "STOPPING CHAT ", "history": history, "stop": True, "payment": False}
-
-    else:
 
-        template = """ Context: You are a customer service agent for a restaurant. You are chatting with a customer who wants to order food. Here is the history of chat you had with the customer: {history}, now the customer is saying {message}. Please respond to the customer in poliet manner. In case there is no history of chat, just respond to the customer current message.
+CHAT_TEMPLATE = """ Context: You are a customer service agent for a restaurant. You are chatting with a customer who wants to order food. Here is the history of chat you had with the customer: {history}, now the customer is saying {message}. Please respond to the customer in poliet manner. In case there is no history of chat, just respond to the customer current message.
         Task: Take Customer Order
         Order: Ask Customer for Dish from Menu, Serve Size, Customization for all orders
         Answer: Just provide the response to the customer. For example: Hi, I am sorry for the inconvenience. I will check with the chef and get back to you.
@@ -157,29 +126,135 @@ def chat(access_token: Annotated[Union[str, None], Header()], message: str = For
         EXAMPLE: If a customer orders a pizza with extra cheese and no onion, you can say: Your order will cost you 10$.
         RESPONSE CONSTRAINT: DONT OUTPUT HISTORY OF CHAT, JUST OUTPUT RESPONSE TO CUSTOMER.
         """
-        prompt = PromptTemplate.from_template(template)
-        chain = prompt | openai_llm_chat
 
-        try:
-            response = str(chain.invoke(
-                {"message": str(message), "history": str("".join(history)), "menu": json.dumps(menu),
-                 "ingredients": json.dumps(ingredients)}))
-            if "STOPPING CHAT" in response or "Stopping Chat" in response or "stopping chat" in response or "Stopping chat" in response or "stop chat" in response or "Stop chat" in response or "STOP CHAT" in response:
-                history.append({"Customer": message, "Agent": response})
-                return {"response": response, "history": history, "stop": True, "payment": True}
-            else:
-                history.append({"Customer": message, "Agent": response})
-                return {"response": response, "history": history, "stop": False, "payment": False}
 
+STOPPING = re.compile(r"stop(?:ping)? chat", re.IGNORECASE)
+
+
+def is_stopping(response):
+    """
+    Whether the agent response ends the chat
+    :param response: Agent response
+    :return: True if the agent stopped the chat
+    """
+    return STOPPING.search(response) is not None
+
+
+async def chat_reply(session_id, session, message, response, fold=True):
+    """
+    Record the turn in the session and build the chat reply
+    :param session_id: Chat session ID
+    :param session: Chat session
+    :param message: Customer message
+    :param response: Agent response
+    :param fold: Fold older turns with the LLM when the session is full, routed intents defer it to the next LLM turn
+    :return: {response, history, stop, payment, session_id}
+    """
+    session = await chat_sessions.append(session_id, session, message, response, fold_history if fold else None)
+    if is_stopping(response):
+        return {"response": response, "history": session["turns"], "stop": True, "payment": True, "session_id": session_id}
+    return {"response": response, "history": session["turns"], "stop": False, "payment": False, "session_id": session_id}
+
+
+async def prepare_chat(access_token, message, session_id, session):
+    """
+    Answer routed intents (payment, stop, menu, price) before any I/O, otherwise build the chain and its variables
+    :return: (reply, None, None) for direct answers, (None, chain, variables) for the LLM
+    """
+    intent, response = intent_router.route(message, access_token=access_token)
+    if intent is not None:
+        if intent.record:
+            return await chat_reply(session_id, session, message, response, fold=False), None, None
+        return {"response": response, "history": session["turns"], "stop": intent.stop, "payment": intent.payment,
+                "session_id": session_id}, None, None
+
+    # Chat with Vertex AI
+    # Use tools for Ingredients and Menu
+
+    ingredients = await read_from_postgres()
+    menu = await read_menu_from_square_catalog(access_token)
+
+    prompt = PromptTemplate.from_template(CHAT_TEMPLATE)
+    chain = prompt | config.get_provider("openai_chat")
+    variables = {"message": str(message), "history": chat_sessions.render(session), "menu": prompt_context.menu(menu),
+                 "ingredients": prompt_context.ingredients(ingredients)}
+    return None, chain, variables
+
+
+@router.post("/chat")
+async def chat(access_token: Annotated[Union[str, None], Header()], message: str = Form(...), history: list = Form([]),
+               session_id: Optional[str] = Form(None)):
+    """
+    This function will chat with Vertex AI
+    :param message:
+    :param history: Only read when the session is new or expired
+    :param session_id: Session ID returned by a previous chat, a new session is started without it
+    :return:
+    """
+    # use read_from_postgres() as a Agent tool to read Ingredients with Langchain
+    # tools = load_tools(tool_names, llm=llm)
+    session_id, session = chat_sessions.open(session_id, history)
+
+    try:
+        reply, chain, variables = await prepare_chat(access_token, message, session_id, session)
+        if reply is not None:
+            return reply
+        response = str(await llm_executor.ainvoke("openai_chat", chain, variables))
+        return await chat_reply(session_id, session, message, response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"An Exception Occurred while chatting with Vertex AI --> {e}")
+        raise HTTPException(status_code=500, detail=f"An Exception Occurred while chatting with Vertex AI --> {e}")
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(access_token: Annotated[Union[str, None], Header()], message: str = Form(...), history: list = Form([]),
+                      session_id: Optional[str] = Form(None)):
+    """
+    Streaming variant of /chat over Server-Sent Events
+    Sends "token" events with {"token"} as the LLM generates them and a final "done" event with
+    {response, history, stop, payment, session_id}, or an "error" event with {detail}
+    :param message:
+    :param history: Only read when the session is new or expired
+    :param session_id: Session ID returned by a previous chat
+    :return: text/event-stream
+    """
+    session_id, session = chat_sessions.open(session_id, history)
+
+    try:
+        reply, chain, variables = await prepare_chat(access_token, message, session_id, session)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"An Exception Occurred while chatting with Vertex AI --> {e}")
+        raise HTTPException(status_code=500, detail=f"An Exception Occurred while chatting with Vertex AI --> {e}")
+
+    async def events():
+        if reply is not None:
+            yield sse_event("done", reply)
+            return
+        tokens = []
+        try:
+            async for token in llm_executor.astream("openai_chat", chain, variables):
+                tokens.append(token)
+                yield sse_event("token", {"token": token})
         except Exception as e:
-            logger.exception(f"An Exception Occurred while chatting with Vertex AI --> {e}")
-            response = "I am sorry, I am not able to understand you. Please try again."
-            raise HTTPException(status_code=500, detail=f"An Exception Occurred while chatting with Vertex AI --> {e}")
-            return {"response": response, "history": history, "stop": True, "payment": False}
+            logger.exception(f"An Exception Occurred while streaming chat with Vertex AI --> {e}")
+            yield sse_event("error", {"detail": f"An Exception Occurred while chatting with Vertex AI --> {e}"})
+            return
+        yield sse_event("done", await chat_reply(session_id, session, message, "".join(tokens)))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.post("/order_summarization")
-def order_summarization(history: str = Form(...)):
+async def order_summarization(history: str = Form(...)):
     """
     This function will summarize the order and redirect to Square Payment API
     :param history:
@@ -203,13 +278,11 @@ def order_summarization(history: str = Form(...)):
         """
 
         prompt = PromptTemplate.from_template(template)
-        chain = prompt | llm
         try:
-            order_summary = chain.invoke({"history":history})
-            try:
-                order_summary = json.loads(cleaned(order_summary))
-            except:
-                order_summary = cleaned(order_summary)
+            llm = config.get_provider("vertex_ai")
+            chain = prompt | llm
+            order_summary = await llm_cache.ainvoke("order_summarization", "vertex_ai", chain, {"history":history}, llm,
+                                                    parse=structured_output.parser("order_summarization"))
         except Exception as e:
             logger.exception(f"An Exception Occurred while summarizing order --> {e}")
             raise HTTPException(status_code=500, detail=f"An Exception Occurred while summarizing order --> {e}")
@@ -218,48 +291,34 @@ def order_summarization(history: str = Form(...)):
 
 
 @router.post("/get_customers")
-def get_customers(access_token: Annotated[Union[str, None], Header()], customer_id: str = Form(...)):
+async def get_customers(access_token: Annotated[Union[str, None], Header()], customer_id: str = Form(...)):
     """
     This function will get customer details from Square
     :param customer_id:
     :return: customer details
     """
-    url = f"https://connect.squareupsandbox.com/v2/customers/{customer_id}"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
-
-    response = requests.get(url, headers=headers)
+    response = await square_gateway.get(f"/v2/customers/{customer_id}", access_token)
 
     if response.status_code == 200:
         logger.info(f"Read from Square")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in reading from Square -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in reading from Square -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 @router.post("/list_customers")
-def list_customers(access_token: Annotated[Union[str, None], Header()]):
+async def list_customers(access_token: Annotated[Union[str, None], Header()]):
     """
     This function will list all customers from Square
     :param customer_id:
     :return: customer details
     """
-    url = "https://connect.squareupsandbox.com/v2/customers"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
-
-    response = requests.get(url, headers=headers)
+    response = await square_gateway.get("/v2/customers", access_token)
     print(response)
 
     if response.status_code == 200:
         logger.info(f"Read from Square")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in reading from Square -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
\ No newline at end of file
+        return json_response(response)
+    else:
+        logger.error(f"Error in reading from Square -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
\ No newline at end of file
@@ -0,0 +1,128 @@
+import logging
+from fastapi import APIRouter, Form
+from typing import Optional
+
+from ..settings.config import Config
+from ..utils.ingredient_repository import ingredient_repository
+from ..utils.square_gateway import square_gateway
+from ..utils.square_catalog import catalog_cache
+from ..utils.inventory_snapshot import inventory
+from ..utils.llm_cache import llm_cache
+from ..utils.llm_executor import llm_executor
+from ..utils.chat_sessions import chat_sessions
+from ..utils.intent_router import intent_router
+from ..utils.structured_output import structured_output
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+config = Config.get_instance()
+
+
+@router.get("/providers")
+def providers_readiness():
+    """
+    Readiness of Postgres, Vertex AI and Open AI providers, postgres_async is the pool of the ingredient repository
+    :return: Readiness per provider
+    """
+    return {**config.providers.readiness(), "postgres_async": ingredient_repository.readiness()}
+
+
+@router.get("/postgres")
+def postgres_pool_metrics():
+    """
+    Postgres connection pool saturation metrics of the async pool and of the write pool
+    :return: Pool size, usage and wait counters per pool, None for a pool that is not created yet
+    """
+    write_ready = config.providers.readiness()["postgres"]["ready"]
+    return {"ready": ingredient_repository.readiness()["ready"] or write_ready,
+            "async": ingredient_repository.metrics(),
+            "write": config.get_provider("postgres").metrics() if write_ready else None,
+            "max_connections": config.postgres_pool_max + config.postgres_write_pool_max}
+
+
+@router.post("/warm_up")
+def warm_up_providers(providers: Optional[str] = Form(None)):
+    """
+    Warm up providers in background
+    :param providers: Comma separated provider names, all providers if empty
+    :return: Providers being warmed up
+    """
+    names = [name.strip() for name in (providers or "").split(",") if name.strip()] or None
+    config.providers.warm_up(names)
+    logger.info(f"Warming up providers {names or 'all'}")
+    return {"message": "Warming up providers", "providers": names or list(config.providers.readiness())}
+
+
+@router.get("/square")
+def square_gateway_metrics():
+    """
+    Square gateway concurrency metrics
+    :return: In-flight calls and limits
+    """
+    return square_gateway.metrics()
+
+
+@router.get("/catalog_cache")
+def catalog_cache_metrics():
+    """
+    Catalog cache hit/miss counters
+    :return: Cache counters and size
+    """
+    return catalog_cache.metrics()
+
+
+@router.get("/inventory")
+def inventory_metrics():
+    """
+    Inventory snapshot version and counters
+    :return: Snapshot counters
+    """
+    return inventory.metrics()
+
+
+@router.get("/llm_cache")
+def llm_cache_metrics():
+    """
+    LLM response cache hit/miss counters per template
+    :return: Backend, size and counters
+    """
+    return llm_cache.metrics()
+
+
+@router.get("/llm")
+def llm_metrics():
+    """
+    LLM concurrency per provider
+    :return: Limit, in flight, waiting, calls and seconds per provider
+    """
+    return llm_executor.metrics()
+
+
+@router.get("/chat_sessions")
+def chat_session_metrics():
+    """
+    Chat session store size and summarization counters
+    :return: Backend, sessions, created, folded and fold_failed
+    """
+    return chat_sessions.metrics()
+
+
+@router.get("/intents")
+def intent_metrics():
+    """
+    Chat turns answered per intent before any I/O, and by the LLM
+    :return: Registered intents and routed counters
+    """
+    return intent_router.metrics()
+
+
+@router.get("/structured_output")
+def structured_output_metrics():
+    """
+    LLM output parse counters per template
+    :return: parsed, repaired, invalid and failed per template
+    """
+    return structured_output.metrics()
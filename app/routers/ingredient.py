@@ -2,9 +2,16 @@ import uuid
 
 import logging
 import json
+import orjson
+from decimal import Decimal
 from fastapi import APIRouter, Form, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from typing import Optional
 
 from ..settings.config import Config
+from ..utils.ingredient_repository import ingredient_repository
+from ..utils.inventory_snapshot import inventory
+from ..utils.units import unit_registry
 
 # logger
 logging.basicConfig(level=logging.INFO)
@@ -12,33 +19,98 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 config = Config.get_instance()
-conn = config.get_postgres_connection()
 
 @router.post("/read")
-def read_ingredients():
+async def read_ingredients(ingredient_type: Optional[str] = Form(None), ingredient_sub_type: Optional[str] = Form(None),
+                           low_stock: Optional[float] = Form(None), name_prefix: Optional[str] = Form(None),
+                           limit: Optional[int] = Form(None), cursor: Optional[int] = Form(None)):
     """
     Read Ingredients from Postgres Supabase
-    :return: Ingredients JSON
+    Without parameters the whole table is served from the inventory snapshot, with any of them one page is queried
+    :param ingredient_type:
+    :param ingredient_sub_type:
+    :param low_stock: Only ingredients with quantity at or below it
+    :param name_prefix: Only ingredients whose name starts with it
+    :param limit: Page size from 1 to 1000, default 100
+    :param cursor: next_cursor of the previous page
+    :return: Ingredients JSON, or {ingredients, next_cursor} for a page
     """
+    filters = dict(ingredient_type=ingredient_type, ingredient_sub_type=ingredient_sub_type, low_stock=low_stock,
+                   name_prefix=name_prefix)
     try:
-        logger.info(f"Reading Ingredients from Postgres")
-        cur = conn.cursor()
-        cur.execute(""" SELECT * FROM "Ingredients" """)
-        rows = cur.fetchall()
-        logger.info(f"Read Ingredients from Postgres")
-        ingredients = []
-        for row in rows:
-            ingredient = {'name': row[2], 'quantity': row[6], 'unit': row[8], 'shelf_life_days': row[5],
-                          'ingredient_type': row[3], 'ingredient_sub_type': row[4], 'ingredient_id': row[0], 'unitprice': row[7] }
-            ingredients.append(ingredient)
-        return json.dumps(ingredients)
+        if all(value is None for value in (*filters.values(), limit, cursor)):
+            logger.info(f"Reading Ingredients from Postgres")
+            snapshot = await inventory.get()
+            logger.info(f"Read Ingredients from inventory snapshot v{snapshot.version}")
+            # Already serialized, the bytes are sent as they are
+            return Response(content=snapshot.json, media_type="application/json")
+        ingredients, next_cursor = await ingredient_repository.query_ingredients(limit=max(1, min(limit or 100, 1000)),
+                                                                                 after_id=cursor, **filters)
+        logger.info(f"Read page of {len(ingredients)} Ingredients from Postgres")
+        return {'ingredients': ingredients, 'next_cursor': next_cursor}
     except Exception as e:
         logger.exception(f"An Exception Occurred while reading Ingredients from Postgres --> {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/export")
+async def export_ingredients(ingredient_type: Optional[str] = Form(None), ingredient_sub_type: Optional[str] = Form(None),
+                             low_stock: Optional[float] = Form(None), name_prefix: Optional[str] = Form(None)):
+    """
+    Export Ingredients as NDJSON, one ingredient per line, read through a server-side cursor
+    :param ingredient_type:
+    :param ingredient_sub_type:
+    :param low_stock: Only ingredients with quantity at or below it
+    :param name_prefix: Only ingredients whose name starts with it
+    :return: application/x-ndjson
+    """
+    rows = ingredient_repository.export_ingredients(ingredient_type=ingredient_type,
+                                                    ingredient_sub_type=ingredient_sub_type, low_stock=low_stock,
+                                                    name_prefix=name_prefix)
+    # Read the first row before answering so that query and connection errors still map to an HTTP error
+    try:
+        first = await rows.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        logger.exception(f"An Exception Occurred while exporting Ingredients from Postgres --> {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def ndjson():
+        # The rows hold a pooled connection and an open cursor, release them even if the client goes away
+        try:
+            if first is None:
+                return
+            yield orjson.dumps(first, default=float) + b"\n"
+            try:
+                async for ingredient in rows:
+                    yield orjson.dumps(ingredient, default=float) + b"\n"
+                logger.info(f"Exported Ingredients from Postgres")
+            except Exception as e:
+                logger.exception(f"An Exception Occurred while exporting Ingredients from Postgres --> {e}")
+                yield orjson.dumps({"error": str(e)}) + b"\n"
+        finally:
+            await rows.aclose()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.post("/units/unknown")
+async def read_unknown_units():
+    """
+    Units of Ingredients that cannot be converted to g, ml or pcs
+    :return: Unknown units with their count and Ingredient names
+    """
+    try:
+        snapshot = await inventory.get()
+        return {'unknown_units': unit_registry.unknown(snapshot.ingredients)}
+    except Exception as e:
+        logger.exception(f"An Exception Occurred while reading Ingredient units --> {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/delete")
-def delete_ingredients(name: str = Form(...)):
+async def delete_ingredients(name: str = Form(...)):
     """
     Delete Ingredients from Postgres Supabase
     :param name:
@@ -46,9 +118,8 @@ def delete_ingredients(name: str = Form(...)):
     """
     try:
         logger.info(f"Deleting Ingredients from Postgres")
-        cur = conn.cursor()
-        cur.execute(""" DELETE FROM "Ingredients" WHERE ingredient_name = %s""", (name,))
-        conn.commit()
+        await ingredient_repository.delete_by_name(name)
+        inventory.patch_delete(name)
         logger.info(f"Deleted Ingredients from Postgres")
     except Exception as e:
         logger.exception(f"An Exception Occurred while deleting Ingredients from Postgres --> {e}")
@@ -58,7 +129,7 @@ def delete_ingredients(name: str = Form(...)):
 
 
 @router.post("/update/quantity")
-def update_ingredients_quantity(name: str = Form(...), quantity: int = Form(...)):
+async def update_ingredients_quantity(name: str = Form(...), quantity: int = Form(...)):
     """
     Update Ingredients quantity in Postgres Supabase
     :param name:
@@ -67,9 +138,8 @@ def update_ingredients_quantity(name: str = Form(...), quantity: int = Form(...)
     """
     try:
         logger.info(f"Updating Ingredients quantity in Postgres")
-        cur = conn.cursor()
-        cur.execute(""" UPDATE "Ingredients" SET quantity = %s WHERE ingredient_name = %s""", (quantity, name))
-        conn.commit()
+        await ingredient_repository.update_quantity(name, quantity)
+        inventory.patch_quantity(name, quantity)
         logger.info(f"Updated Ingredients quantity in Postgres")
     except Exception as e:
         logger.exception(f"An Exception Occurred while updating Ingredients quantity in Postgres --> {e}")
@@ -77,3 +147,65 @@ def update_ingredients_quantity(name: str = Form(...), quantity: int = Form(...)
 
     return {'message': "Updated Ingredients quantity in Postgres", 'status': 'success'}
 
+
+@router.post("/update/quantities")
+async def update_ingredients_quantities(updates: str = Form(...)):
+    """
+    Stock-take, update many Ingredients quantities in Postgres Supabase with one UPDATE in one transaction
+    :param updates: JSON array of {id or name, quantity} to set a quantity or {id or name, delta} to adjust it,
+                    e.g. [{"name": "tomato", "quantity": 12}, {"id": 7, "delta": -2}]
+    :return: updated [{row, ingredient_id, name, before, after}], not_found and errors by row (index in updates),
+             an entry targeting an ingredient already updated by an earlier entry is an error
+    """
+    try:
+        entries = json.loads(updates)
+        if not isinstance(entries, list):
+            raise ValueError("updates must be a JSON array")
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"Invalid updates --> {e}")
+
+    ids, names, values, deltas, rows, errors, seen = [], [], [], [], [], [], set()
+    for row, entry in enumerate(entries):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError("expected an object")
+            key = ('id', int(entry['id'])) if entry.get('id') is not None else ('name', entry.get('name'))
+            if not key[1]:
+                raise ValueError("missing id or name")
+            if key in seen:
+                raise ValueError(f"duplicate {key[0]} {key[1]}")
+            if (entry.get('quantity') is None) == (entry.get('delta') is None):
+                raise ValueError("expected one of quantity or delta")
+            value = Decimal(str(entry['quantity'] if entry.get('quantity') is not None else entry['delta']))
+        except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+            errors.append({'row': row, 'error': str(e)})
+            continue
+        seen.add(key)
+        ids.append(key[1] if key[0] == 'id' else None)
+        names.append(key[1] if key[0] == 'name' else None)
+        values.append(value)
+        deltas.append(entry.get('delta') is not None)
+        rows.append(row)
+
+    try:
+        logger.info(f"Updating {len(rows)} Ingredients quantities in Postgres")
+        updated, conflicts = await ingredient_repository.update_quantities(ids, names, values, deltas) if rows \
+            else ([], [])
+        if updated:
+            inventory.patch_quantities({item['ingredient_id']: item['after'] for item in updated})
+        logger.info(f"Updated {len(updated)} Ingredients quantities in Postgres")
+    except Exception as e:
+        logger.exception(f"An Exception Occurred while updating Ingredients quantities in Postgres --> {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    found = set()
+    for item in updated:
+        item['row'] = rows[item.pop('position')]
+        found.add(item['row'])
+    for conflict in conflicts:
+        found.add(rows[conflict['position']])
+        errors.append({'row': rows[conflict['position']],
+                       'error': f"ingredient {conflict['ingredient_id']} is already updated by row "
+                                f"{rows[conflict['claimed_by']]}"})
+    return {'updated': sorted(updated, key=lambda item: item['row']), 'not_found': [row for row in rows if row not in found],
+            'errors': sorted(errors, key=lambda error: error['row']), 'status': 'success'}
@@ -4,9 +4,9 @@ import datetime
 import logging
 from fastapi import APIRouter, Form, HTTPException, Header
 from typing import Optional, Annotated, Union
-import requests
 
 from ..settings.config import Config
+from ..utils.square_gateway import square_gateway, error_detail, json_response
 from ..utils.square_payments import get_square_connection
 
 # logger
@@ -17,7 +17,7 @@ router = APIRouter()
 config = Config.get_instance()
 
 @router.post("/create_customer")
-def create_customer(access_token: Annotated[Union[str, None], Header()], first_name: str = Form(...), last_name: str = Form(...), email: str = Form(...), phone_number: str = Form(...), address_line_1: str = Form(...), address_line_2: Optional[str] = Form(None),  postal_code: str = Form(...), country: str = Form(...), birthday: str = Form(...),):
+async def create_customer(access_token: Annotated[Union[str, None], Header()], first_name: str = Form(...), last_name: str = Form(...), email: str = Form(...), phone_number: str = Form(...), address_line_1: str = Form(...), address_line_2: Optional[str] = Form(None),  postal_code: str = Form(...), country: str = Form(...), birthday: str = Form(...),):
     """
     Create a new customer object with price
     :param access_token:
@@ -39,12 +39,6 @@ def create_customer(access_token: Annotated[Union[str, None], Header()], first_n
         raise HTTPException(status_code=500, detail="Birthday format is not correct, please use YYYY-MM-DD")
 
 
-    url = "https://connect.squareupsandbox.com/v2/customers"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
     data = {
         "given_name": first_name,
         "family_name": last_name,
@@ -59,22 +53,22 @@ def create_customer(access_token: Annotated[Union[str, None], Header()], first_n
         "birthday": birthday
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = await square_gateway.post("/v2/customers", access_token, json=data)
     print(response)
 
     if response.status_code == 200:
         logger.info(f"Created Customer Object {first_name} {last_name}")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in creating customer Item -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in creating customer Item -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 
 
 
 
 @router.post("/create")
-def create_invoice_object(access_token: Annotated[Union[str, None], Header()],location_id: Annotated[Union[str, None], Header()], order_id: str = Form(...), reference_id: Optional[str] = Form(None), customer_id: str = Form(...)):
+async def create_invoice_object(access_token: Annotated[Union[str, None], Header()],location_id: Annotated[Union[str, None], Header()], order_id: str = Form(...), reference_id: Optional[str] = Form(None), customer_id: str = Form(...)):
     """
     Create a new invoice object with price
     :param price:
@@ -154,12 +148,6 @@ def create_invoice_object(access_token: Annotated[Union[str, None], Header()],lo
     print(due_date)
 
 
-    url = "https://connect.squareupsandbox.com/v2/invoices"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
     data = {"invoice": {
                 "location_id": location_id,
                 "order_id": order_id,
@@ -185,92 +173,72 @@ def create_invoice_object(access_token: Annotated[Union[str, None], Header()],lo
         }
         }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = await square_gateway.post("/v2/invoices", access_token, json=data)
     print(response)
 
     if response.status_code == 200:
         logger.info(f"Created Invoice Object {order_id}")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in creating invoice Item -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in creating invoice Item -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 
 @router.post("/delete")
-def delete_invoice_object(access_token: Annotated[Union[str, None], Header()], invoice_object_id: list = Form(...)):
+async def delete_invoice_object(access_token: Annotated[Union[str, None], Header()], invoice_object_id: list = Form(...)):
     """
     Delete invoice object
     :param invoice_object_id:
     :return: Result of the deletion
     """
-    url = f"https://connect.squareupsandbox.com/v2/invoices/{invoice_object_id}"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
-
-    response = requests.delete(url, headers=headers)
+    response = await square_gateway.delete(f"/v2/invoices/{invoice_object_id}", access_token)
 
     if response.status_code == 200:
         logger.info(f"Deleted Invoice Object {invoice_object_id}")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in deleting invoice Item -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in deleting invoice Item -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 
 
 @router.post("/get")
-def get_invoice_object(access_token: Annotated[Union[str, None], Header()], invoice_id: str = Form(...)):
+async def get_invoice_object(access_token: Annotated[Union[str, None], Header()], invoice_id: str = Form(...)):
     """
     Get invoice object
     :param invoice_id:
     :return: Invoice Objects
     """
-    url = f"https://connect.squareupsandbox.com/v2/invoices/{invoice_id}"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
-
-    response = requests.get(url, headers=headers)
+    response = await square_gateway.get(f"/v2/invoices/{invoice_id}", access_token)
 
     if response.status_code == 200:
         logger.info(f"Get Invoice Object {invoice_id}")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in getting invoice Item -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in getting invoice Item -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 
 @router.post("/publish")
-def publish_invoice_object(access_token: Annotated[Union[str, None], Header()], invoice_id: str = Form(...)):
+async def publish_invoice_object(access_token: Annotated[Union[str, None], Header()], invoice_id: str = Form(...)):
     """
     Publish invoice object
     :param invoice_id:
     :return: Invoice Objects
     """
-    url = f"https://connect.squareupsandbox.com/v2/invoices/{invoice_id}/publish"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
     data = {
         "idempotency_key": str(uuid.uuid4()),
         "version": 1
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = await square_gateway.post(f"/v2/invoices/{invoice_id}/publish", access_token, json=data)
 
     if response.status_code == 200:
         logger.info(f"Publish Invoice Object {invoice_id}")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in publishing invoice Item -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in publishing invoice Item -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 
 
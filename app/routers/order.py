@@ -3,10 +3,10 @@ import uuid
 import logging
 from fastapi import APIRouter, Form, HTTPException, Header
 from typing import Annotated, Union
-import requests
 import json
 
 from ..settings.config import Config
+from ..utils.square_gateway import square_gateway, error_detail, json_response
 from ..utils.square_payments import get_square_connection
 
 # logger
@@ -17,7 +17,7 @@ router = APIRouter()
 config = Config.get_instance()
 
 @router.post("/create")
-def create_order_object(access_token: Annotated[Union[str, None], Header()], location_id: Annotated[Union[str, None], Header()], orders: list = Form(...), customer_id: str = Form(...) ):
+async def create_order_object(access_token: Annotated[Union[str, None], Header()], location_id: Annotated[Union[str, None], Header()], orders: list = Form(...), customer_id: str = Form(...) ):
     """
     Create a new order object
     Comes from Order summary API
@@ -55,12 +55,6 @@ def create_order_object(access_token: Annotated[Union[str, None], Header()], loc
     #
     # return result.body
 
-    url = "https://connect.squareupsandbox.com/v2/orders"
-    headers = {
-        'square-version': '2021-05-13',
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-    }
     orders_post=[]
     if type(orders[0])==dict:
         orders_post = orders
@@ -89,17 +83,17 @@ def create_order_object(access_token: Annotated[Union[str, None], Header()], loc
         "idempotency_key": str(uuid.uuid4())
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = await square_gateway.post("/v2/orders", access_token, json=data)
 
     if response.status_code == 200:
         logger.info(f"Created Order Object")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in creating order -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in creating order -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 @router.post("/get")
-def get_order_object(access_token: Annotated[Union[str, None], Header()], order_id: str = Form(...)):
+async def get_order_object(access_token: Annotated[Union[str, None], Header()], order_id: str = Form(...)):
     """
     Get order object
     :param order_id:
@@ -118,24 +112,17 @@ def get_order_object(access_token: Annotated[Union[str, None], Header()], order_
     #
     # return result.body
 
-    url = f"https://connect.squareupsandbox.com/v2/orders/{order_id}"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
-
-    response = requests.get(url, headers=headers)
+    response = await square_gateway.get(f"/v2/orders/{order_id}", access_token)
 
     if response.status_code == 200:
         logger.info(f"Get Order Object")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in getting order -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in getting order -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
 
 @router.post("/pay")
-def pay_order_object(access_token: Annotated[Union[str, None], Header()], order_id: str = Form(...), payment_ids : list = Form(...)):
+async def pay_order_object(access_token: Annotated[Union[str, None], Header()], order_id: str = Form(...), payment_ids : list = Form(...)):
     """
     Pay order object
     :param order_id:
@@ -158,23 +145,17 @@ def pay_order_object(access_token: Annotated[Union[str, None], Header()], order_
     #
     # return result.body
 
-    url = f"https://connect.squareupsandbox.com/v2/orders/{order_id}/pay"
-    headers = {
-        "Square-Version": "2023-09-25",
-        "Authorization": "Bearer " + access_token,
-        "Content-Type": "application/json"
-    }
 
     data = {
         "idempotency_key": str(uuid.uuid4()),
         "payment_ids": payment_ids
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = await square_gateway.post(f"/v2/orders/{order_id}/pay", access_token, json=data)
 
     if response.status_code == 200:
         logger.info(f"Pay Order Object")
-        return response.json()
-    elif response.status_code == 400:
-        logger.error(f"Error in paying order -->    {response.json()}")
-        raise HTTPException(status_code=500, detail=str(response.json()))
+        return json_response(response)
+    else:
+        logger.error(f"Error in paying order -->    {error_detail(response)}")
+        raise HTTPException(status_code=500, detail=error_detail(response))
@@ -2,10 +2,12 @@ import uuid
 
 import logging
 from fastapi import APIRouter, Form, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional, Annotated, Union
 
 from ..settings.config import Config
-from ..utils.square_payments import get_square_connection
+from ..utils.square_gateway import square_gateway
+from ..utils.square_payments import get_square_connection, invalidate_on_auth_error
 
 # logger
 logging.basicConfig(level=logging.INFO)
@@ -17,7 +19,7 @@ config = Config.get_instance()
 # PAYMENT API
 # need to add multiple payment types based on source_id
 @router.post("/create")
-def create_payment(access_token: Annotated[Union[str, None], Header()], source_id: str = Form(...), amount: int = Form(...), currency: Optional[str] = Form(None),
+async def create_payment(access_token: Annotated[Union[str, None], Header()], source_id: str = Form(...), amount: int = Form(...), currency: Optional[str] = Form(None),
                    tip: Optional[int] = Form(None) , customer_id: str = Form(...)):
     """
     Create a payment
@@ -28,11 +30,12 @@ def create_payment(access_token: Annotated[Union[str, None], Header()], source_i
     :param amount:
     :return: Payment Details
     """
-    square_client, square_location_id = get_square_connection(access_token)
+    square_client, square_location_id = await run_in_threadpool(get_square_connection, access_token)
     reference_id = str(uuid.uuid4())
     idempotency = str(uuid.uuid4())
-    result = square_client.payments.create_payment(
-        body={
+    result = await square_gateway.post(
+        "/v2/payments", access_token,
+        json={
             "source_id": source_id,
             "idempotency_key": idempotency,
             "amount_money": {
@@ -49,58 +52,61 @@ def create_payment(access_token: Annotated[Union[str, None], Header()], source_i
             "note": "Payment done for the order",
             "customer_id": customer_id,
         })
-    if result.is_success():
+    if result.is_success:
         logger.info(f"Created Payment {reference_id}")
-        return {"body": result.body, "reference_id": reference_id, "idempotency": idempotency, "status": "success"}
-    elif result.is_error():
-        logger.error(f"Error in creating Payment -->    {result.errors}")
-        raise HTTPException(status_code=500, detail=str(result.errors))
+        return {"body": result.json(), "reference_id": reference_id, "idempotency": idempotency, "status": "success"}
+    else:
+        errors = result.json().get('errors')
+        logger.error(f"Error in creating Payment -->    {errors}")
+        invalidate_on_auth_error(access_token, errors)
+        raise HTTPException(status_code=500, detail=str(errors))
 
 
 @router.post("/cancel")
-def cancel_payment_by_idempotency(access_token: Annotated[Union[str, None], Header()], idempotency_key: str = Form(...)):
+async def cancel_payment_by_idempotency(access_token: Annotated[Union[str, None], Header()], idempotency_key: str = Form(...)):
     """
     Cancel a payment
     :param idempotency_key:
     :return: Status of the cancellation
     """
-    square_client, square_location_id = get_square_connection(access_token)
-    result = square_client.payments.cancel_payment_by_idempotency_key(
-        body={
+    result = await square_gateway.post(
+        "/v2/payments/cancel", access_token,
+        json={
             "idempotency_key": idempotency_key
         }
     )
 
-    if result.is_success():
+    if result.is_success:
         logger.info(f"Cancelled Payment")
         return {"body": "result.body", "status": "success"}
-    elif result.is_error():
-        logger.error(f"Error in cancelling Payment -->    {result.errors}")
-        raise HTTPException(status_code=500, detail=str(result.errors))
+    else:
+        errors = result.json().get('errors')
+        logger.error(f"Error in cancelling Payment -->    {errors}")
+        invalidate_on_auth_error(access_token, errors)
+        raise HTTPException(status_code=500, detail=str(errors))
 
 
 @router.post("/get")
-def get_payment_by_id(access_token: Annotated[Union[str, None], Header()], payment_id: str = Form(...)):
+async def get_payment_by_id(access_token: Annotated[Union[str, None], Header()], payment_id: str = Form(...)):
     """
     Get a payment
     :param payment_id:
     :return: Payment Details
     """
-    square_client, square_location_id = get_square_connection(access_token)
-    result = square_client.payments.get_payment(
-        payment_id=payment_id
-    )
+    result = await square_gateway.get(f"/v2/payments/{payment_id}", access_token)
 
-    if result.is_success():
+    if result.is_success:
         logger.info(f"Get Payment")
-        return {"body": result.body, "status": "success"}
-    elif result.is_error():
-        logger.error(f"Error in getting Payment -->    {result.errors}")
-        raise HTTPException(status_code=500, detail=str(result.errors))
+        return {"body": result.json(), "status": "success"}
+    else:
+        errors = result.json().get('errors')
+        logger.error(f"Error in getting Payment -->    {errors}")
+        invalidate_on_auth_error(access_token, errors)
+        raise HTTPException(status_code=500, detail=str(errors))
 
 
 @router.post("/update")
-def update_payment_by_id(access_token: Annotated[Union[str, None], Header()], payment_id: str = Form(...), amount: int = Form(...), currency: Optional[str] = Form(None),
+async def update_payment_by_id(access_token: Annotated[Union[str, None], Header()], payment_id: str = Form(...), amount: int = Form(...), currency: Optional[str] = Form(None),
                          tip: Optional[int] = Form(None)):
     """
     Update a payment
@@ -110,11 +116,10 @@ def update_payment_by_id(access_token: Annotated[Union[str, None], Header()], pa
     :param tip:
     :return: Updated Payment Details
     """
-    square_client, square_location_id = get_square_connection(access_token)
     idempotency = str(uuid.uuid4())
-    result = square_client.payments.update_payment(
-        payment_id=payment_id,
-        body={
+    result = await square_gateway.put(
+        f"/v2/payments/{payment_id}", access_token,
+        json={
             "amount_money": {
                 "amount": amount,
                 "currency": currency or "USD",
@@ -129,30 +134,30 @@ def update_payment_by_id(access_token: Annotated[Union[str, None], Header()], pa
         }
     )
 
-    if result.is_success():
+    if result.is_success:
         logger.info(f"Updated Payment")
-        return {"body": result.body, "status": "success"}
-    elif result.is_error():
-        logger.error(f"Error in updating Payment -->    {result.errors}")
-        raise HTTPException(status_code=500, detail=str(result.errors))
+        return {"body": result.json(), "status": "success"}
+    else:
+        errors = result.json().get('errors')
+        logger.error(f"Error in updating Payment -->    {errors}")
+        invalidate_on_auth_error(access_token, errors)
+        raise HTTPException(status_code=500, detail=str(errors))
 
 
 @router.post("/complete")
-def complete_payment_by_id(access_token: Annotated[Union[str, None], Header()], payment_id: str = Form(...)):
+async def complete_payment_by_id(access_token: Annotated[Union[str, None], Header()], payment_id: str = Form(...)):
     """
     Complete a payment
     :param payment_id:
     :return: Payment Details
     """
-    square_client, square_location_id = get_square_connection(access_token)
-    result = square_client.payments.complete_payment(
-        payment_id=payment_id,
-        body={},
-    )
+    result = await square_gateway.post(f"/v2/payments/{payment_id}/complete", access_token, json={})
 
-    if result.is_success():
+    if result.is_success:
         logger.info(f"Completed Payment")
-        return {"body": result.body, "status": "success"}
-    elif result.is_error():
-        logger.error(f"Error in completing Payment -->    {result.errors}")
-        raise HTTPException(status_code=500, detail=str(result.errors))
+        return {"body": result.json(), "status": "success"}
+    else:
+        errors = result.json().get('errors')
+        logger.error(f"Error in completing Payment -->    {errors}")
+        invalidate_on_auth_error(access_token, errors)
+        raise HTTPException(status_code=500, detail=str(errors))
@@ -1,14 +1,20 @@
+import io
 import logging
-import json
 
-from fastapi import APIRouter, Form, HTTPException, Header
+from fastapi import APIRouter, File, Form, HTTPException, Header, UploadFile
 from langchain.prompts import PromptTemplate
 from langchain.utilities.dalle_image_generator import DallEAPIWrapper
-from langchain.chains import LLMChain
-from square.client import Client
 
 from ..settings.config import Config
-from ..utils.clean import cleaned
+from ..utils.square_payments import get_square_connection
+from ..utils.inventory_snapshot import inventory
+from ..utils.ingredient_summary import ingredient_summary
+from ..utils.ingredient_import import IngredientImportError, copy_ingredients, iter_records
+from ..utils.pricing import price_engine
+from ..utils.prompt_context import prompt_context
+from ..utils.llm_cache import llm_cache, model_params
+from ..utils.llm_executor import llm_executor
+from ..utils.structured_output import structured_output
 from typing import Optional, Annotated, Union
 
 
@@ -17,21 +23,17 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 config = Config.get_instance()
-conn = config.get_postgres_connection()
-llm = config.get_vertex_ai_connection()
-dalle_llm = config.get_open_ai_connection()
-chatbot_llm = config.get_openai_text_connection()
 
 router = APIRouter()
 
 
 @router.post("/recommend_menu", tags=["seller"])
-def recommend_menu(preferred_cuisine: str = Form(...), prep_time_breakfast: str = Form(...),
+async def recommend_menu(preferred_cuisine: str = Form(...), prep_time_breakfast: str = Form(...),
                    prep_time_lunch: str = Form(...), prep_time_dinner: str = Form(...),
                    cook_time_breakfast: str = Form(...), cook_time_lunch: str = Form(...),
                    cook_time_dinner: str = Form(...)):
     """
-    Recommend menu using Vertex AI
+    Recommend menu using Vertex AI, the LLM names the dishes and their ingredients and the prices are computed locally
     :param cook_time_dinner:
     :param preferred_cuisine:
     :param prep_time_breakfast:
@@ -44,20 +46,11 @@ def recommend_menu(preferred_cuisine: str = Form(...), prep_time_breakfast: str
     """
     logger.info(f"Reading ingredients from Ingredient table of postgres")
     try:
-        cur = conn.cursor()
-        cur.execute("""SELECT * FROM "Ingredients" """)
-        rows = cur.fetchall()
-        # Column Names - id, Created_at,ingredient_name,ingredient_type, ingredient_sub_type, shelf_life_days, quantity, unit
-        logger.info(f"Total number of ingredients in the table: {len(rows)}")
         # Create a list of Dictionary of Ingredients with Name, quantity unit, shelf life days, ingredient type,
         # ingredient sub type
-        ingredients = []
-        for row in rows:
-            ingredient = {'name': row[2], 'quantity': row[6], 'unit': row[8], 'shelf_life_days': row[5],
-                          'ingredient_type': row[3], 'ingredient_sub_type': row[4], 'ingredient_id': row[0],
-                          'unitprice': row[7]}
-            ingredients.append(ingredient)
-        logger.info(f"Read ingredients from Postgres")
+        ingredients = await inventory.get()
+        logger.info(f"Total number of ingredients in the table: {len(ingredients)}")
+        logger.info(f"Read ingredients from inventory snapshot v{ingredients.version}")
 
     except Exception as e:
         # Raise HTTP exception
@@ -67,58 +60,30 @@ def recommend_menu(preferred_cuisine: str = Form(...), prep_time_breakfast: str
     # Pass the list to Context and generate the menu
     template = """ 
      **Context:**
-You are a chef at a {preferred_cuisine} restaurant. Your kitchen is stocked with essential ingredients such as flour, water, spices, milk, curd, onion, tomato, ginger, garlic, oil, butter, and ghee, each with its unit price. Your mission is to craft a menu for the restaurant that reflects your culinary style. 
+You are a chef at a {preferred_cuisine} restaurant. Your kitchen is stocked with essential ingredients such as flour, water, spices, milk, curd, onion, tomato, ginger, garlic, oil, butter, and ghee. Here is the inventory of the kitchen: {ingredients}. Your mission is to craft a menu for the restaurant that reflects your culinary style. 
 
 **Task:**
-Prepare a comprehensive menu featuring at least 25 dishes per categories: Breakfast, Lunch, Dinner, Dessert, Drinks, Sides, and Breads. For each category, there must be a minimum of 10 dishes. Additionally, ensure that the menu itemizes the price of each dish.
-
-**Price Calculation:**
-- The cost of one ingredient is determined using the formula: Price = (Quantity * Unit Price). For instance, if a dish requires 2 potatoes, and each potato costs 10, the price of potatoes for that dish is 20. This calculation applies to all ingredients.
-
-- The price of a dish is calculated using the formula: Price = (Sum of Price of all ingredients + 30% of the sum + 5% of the sum) + 10% tax. For example, if the total cost of all ingredients needed for a dish is 100, the price of the dish is 135 (100 + 30 + 5) + 10% tax, making it 148.5 in total.
+Prepare a comprehensive menu featuring at least 25 dishes per categories: Breakfast, Lunch, Dinner, Dessert, Drinks, Sides, and Breads. For each category, there must be a minimum of 10 dishes. For each dish, list the ingredients of one serving with their quantity and unit, prices are calculated by the restaurant from these.
 
 **Answer:**
-Provide the menu in JSON key-value (Keys are Course, Dish name, Customization & Price) pairs without special characters. This includes the course name, dish name, its price, and any customizations based on the ingredients. Ensure that there are at least 3 dishes for each category. Here's the output format:
+Provide the menu in JSON key-value (Keys are Course, Dish name, Customization & Ingredients) pairs without special characters. This includes the course name, dish name, any customizations based on the ingredients and the ingredients of one serving. Use ingredient names from the inventory and units like g, kg, ml, l or pcs. Ensure that there are at least 3 dishes for each category. Here's the output format:
 
 ```
 (Breakfast: 
   (Dish1: 
     (Customization: ["Option1", "Option2"], 
-    Price: amount), 
+    Ingredients: [(name: ingredient, quantity: amount, unit: unit)]), 
   Dish2: 
-    (Price: amount)), 
+    (Ingredients: [(name: ingredient, quantity: amount, unit: unit)])), 
 (Lunch: 
   (Dish3: 
-    (Price: amount, 
-    Customization: ["No onion"]), 
-  Dish4: 
-    (Price: amount)), 
-(Dinner: 
-  (Dish5: 
-    (Price: amount, 
-    Customization: ["Low spice", "No onion"]), 
-  Dish6: 
-    (Price: amount)), 
-(Dessert: 
-  (Dish7: 
-    (Price: amount), 
-  Dish8: 
-    (Price: amount)), 
-(Drinks: 
-  (Dish9: 
-    (Price: amount), 
-  Dish10: 
-    (Price: amount)), 
-(Sides: 
-  (Dish11: 
-    (Price: amount), 
-  Dish12: 
-    (Price: amount)), 
-(Breads: 
-  (Dish13: 
-    (Price: amount), 
-  Dish14: 
-    (Price: amount)))
+    (Ingredients: [(name: ingredient, quantity: amount, unit: unit)], 
+    Customization: ["No onion"]))), 
+(Dinner: ...), 
+(Dessert: ...), 
+(Drinks: ...), 
+(Sides: ...), 
+(Breads: ...))
 ```
 
 **Example:**
@@ -127,84 +92,21 @@ Provide the menu in JSON key-value (Keys are Course, Dish name, Customization &
   "Breakfast": (
     "Scrambled Eggs": (
       "Customization": ["Cheese", "Bacon"],
-      "Price": 8.5
+      "Ingredients": [("name": "egg", "quantity": 2, "unit": "pcs"), ("name": "butter", "quantity": 10, "unit": "g")]
     ),
     "Pancakes": (
-      "Price": 7.0
-    ),
-    "Omelette": (
-      "Customization": ["Spinach", "Tomato"],
-      "Price": 9.0
+      "Ingredients": [("name": "flour", "quantity": 100, "unit": "g"), ("name": "milk", "quantity": 150, "unit": "ml")]
     )
   ),
   "Lunch": (
-    "Chicken Curry": (
-      "Price": 12.0,
-      "Customization": ["Spicy", "No Onion"]
-    ),
     "Vegetable Biryani": (
-      "Price": 10.5
-    ),
-    "Grilled Cheese Sandwich": (
-      "Customization": ["Extra Cheese"],
-      "Price": 6.5
-    )
-  ),
-  "Dinner": (
-    "Steak": (
-      "Price": 18.0,
-      "Customization": ["Medium Rare", "No Onion"]
-    ),
-    "Salmon Fillet": (
-      "Price": 15.5
-    ),
-    "Pasta Carbonara": (
-      "Customization": ["Extra Bacon"],
-      "Price": 13.0
-    )
-  ),
-  "Dessert": (
-    "Chocolate Cake": (
-      "Price": 6.5
-    ),
-    "Tiramisu": (
-      "Price": 8.0
-    ),
-    "Fruit Salad": (
-      "Price": 5.0
+      "Customization": ["Spicy", "No Onion"],
+      "Ingredients": [("name": "rice", "quantity": 150, "unit": "g"), ("name": "onion", "quantity": 1, "unit": "pcs")]
     )
   ),
   "Drinks": (
-    "Margarita": (
-      "Price": 9.0
-    ),
-    "Mojito": (
-      "Price": 7.5
-    ),
     "Iced Tea": (
-      "Price": 3.5
-    )
-  ),
-  "Sides": (
-    "Garlic Bread": (
-      "Price": 4.0
-    ),
-    "French Fries": (
-      "Price": 4.0
-    ),
-    "Coleslaw": (
-      "Price": 3.0
-    )
-  ),
-  "Breads": (
-    "Garlic Naan": (
-      "Price": 2.5
-    ),
-    "Whole Wheat Roti": (
-      "Price": 2.0
-    ),
-    "Ciabatta": (
-      "Price": 2.0
+      "Ingredients": [("name": "tea", "quantity": 5, "unit": "g"), ("name": "water", "quantity": 250, "unit": "ml")]
     )
   )
 )
@@ -215,28 +117,28 @@ Provide the menu in JSON key-value (Keys are Course, Dish name, Customization &
 - Ensure that the menu aligns with the {preferred_cuisine}.
 - Breakfast, lunch, and dinner preparation times must not exceed {prep_time_breakfast}, {prep_time_lunch}, and {prep_time_dinner} respectively.
 - Breakfast, lunch, and dinner cooking times should not surpass {cook_time_breakfast}, {cook_time_lunch}, and {cook_time_dinner} respectively.
-- Just output Course, Dish name, Customization & Price in the JSON key-value pairs. Do not include the recipe or ingredients.
+- Just output Course, Dish name, Customization & Ingredients in the JSON key-value pairs. Do not include the recipe or prices.
 
 **Definitions:**
 - Prep time: The time taken to prepare the dish.
 - Cook time: The time taken to cook the dish. 
 
-Just output Course, Dish name, Customization & Price in the JSON key-value pairs. Do not include the recipe or ingredients or code or any other text."""
+Just output Course, Dish name, Customization & Ingredients in the JSON key-value pairs. Do not include the recipe or prices or code or any other text."""
 
     prompt = PromptTemplate.from_template(template)
-    chain = prompt | chatbot_llm
 
     # Generate the menu
     try:
-        s =  chain.invoke({'preferred_cuisine': preferred_cuisine, 'ingredients': ingredients,
-                             'prep_time_breakfast': prep_time_breakfast, 'prep_time_lunch': prep_time_lunch,
-                             'prep_time_dinner': prep_time_dinner, 'cook_time_breakfast': cook_time_breakfast,
-                             'cook_time_lunch': cook_time_lunch, 'cook_time_dinner': cook_time_dinner})
-        try:
-            return json.loads(cleaned(s))
-        except Exception as e:
-            print(e)
-            return cleaned(s)
+        chatbot_llm = config.get_provider("openai_text")
+        chain = prompt | chatbot_llm
+        variables = {'preferred_cuisine': preferred_cuisine, 'ingredients': prompt_context.ingredients(ingredients),
+                     'prep_time_breakfast': prep_time_breakfast, 'prep_time_lunch': prep_time_lunch,
+                     'prep_time_dinner': prep_time_dinner, 'cook_time_breakfast': cook_time_breakfast,
+                     'cook_time_lunch': cook_time_lunch, 'cook_time_dinner': cook_time_dinner}
+        menu = await llm_cache.ainvoke("recommend_menu", "openai_text", chain, variables, chatbot_llm,
+                                       parse=structured_output.parser("recommend_menu"))
+        # Prices are computed from the ingredients of each dish and the unit prices of the Ingredients table
+        return price_engine.price_menu(menu, ingredients)
     except Exception as e:
         logger.exception(f"An Exception Occurred while generating menu using Vertex AI --> {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -268,11 +170,13 @@ def add_ingedients(ingredient_name: str = Form(...), ingredient_type: str = Form
         unit = unit.lower()
 
 
-        cur = conn.cursor()
-        cur.execute(
-            """INSERT INTO "Ingredients"(ingredient_name,ingredient_type,ingredient_sub_type,shelf_life_days,quantity,units,unitprice) VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-            (ingredient_name, ingredient_type, ingredient_sub_type, shelf_life_days, quantity, unit, unitprice))
-        conn.commit()
+        with config.postgres_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """INSERT INTO "Ingredients"(ingredient_name,ingredient_type,ingredient_sub_type,shelf_life_days,quantity,units,unitprice) VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                (ingredient_name, ingredient_type, ingredient_sub_type, shelf_life_days, quantity, unit, unitprice))
+            conn.commit()
+        inventory.invalidate()
         logger.info(f"Added ingredients to Postgres")
         return {"message": "Ingredient added successfully"}
     except Exception as e:
@@ -280,25 +184,57 @@ def add_ingedients(ingredient_name: str = Form(...), ingredient_type: str = Form
         logger.exception(f"An Exception Occurred while adding ingredients to Postgres --> {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/import_ingredients", tags=["seller"])
+def import_ingredients(file: Optional[UploadFile] = File(None), ingredients: Optional[str] = Form(None),
+                       file_format: Optional[str] = Form(None)):
+    """
+    Bulk add ingredients to Ingredient table of postgres with one COPY in one transaction
+    Same rules as /add_ingedients, rows that fail validation are skipped and reported
+    :param file: CSV or JSON upload, CSV is streamed into COPY as it is read
+    :param ingredients: CSV text or JSON array in the form instead of a file
+    :param file_format: csv or json, detected from the file name or content when not given
+    :return: {rows, imported, errors: [{row, error}], error_count}
+    """
+    if file is None and not ingredients:
+        raise HTTPException(status_code=500, detail="Provide a file or ingredients to import")
+    try:
+        if file is not None:
+            file_format = file_format or ("json" if (file.filename or "").lower().endswith(".json")
+                                          or "json" in (file.content_type or "") else "csv")
+            stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+        else:
+            file_format = file_format or ("json" if ingredients.lstrip().startswith("[") else "csv")
+            stream = io.StringIO(ingredients, newline="")
+        records = iter_records(stream, file_format.lower())
+
+        with config.postgres_connection() as conn:
+            report = copy_ingredients(conn, records)
+        inventory.invalidate()
+        logger.info(f"Imported {report['imported']} of {report['rows']} ingredients to Postgres")
+        return report
+    except IngredientImportError as e:
+        logger.error(f"Postgres rejected the ingredient import --> {e}")
+        raise HTTPException(status_code=500, detail=e.report)
+    except Exception as e:
+        logger.exception(f"An Exception Occurred while importing ingredients to Postgres --> {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/get_ingredient_summary", tags=["seller"])
-def get_ingredient_summary():
+async def get_ingredient_summary(use_llm: bool = Form(False)):
     """
     Get ingredient summary from Ingredient table of postgres
-    :return: ingredient summary
+    Ingredients are grouped by type and normalized name and their quantities summed after unit conversion,
+    use_llm asks the LLM for the summary instead
+    :param use_llm: Summarize with the LLM
+    :return: ingredient summary {ingredient_type: [{name, quantity, unit}]}
     """
     try:
-        cur = conn.cursor()
-        cur.execute("""SELECT * FROM "Ingredients" """)
-        rows = cur.fetchall()
-        # Column Names - id, Created_at,ingredient_name,ingredient_type, ingredient_sub_type, shelf_life_days, quantity, unit
-        logger.info(f"Total number of ingredients in the table: {len(rows)}")
-        ingredients = []
-        for row in rows:
-            ingredient = {'name': row[2], 'quantity': row[6], 'unit': row[8], 'shelf_life_days': row[5],
-                          'ingredient_type': row[3], 'ingredient_sub_type': row[4], 'ingredient_id': row[0],
-                          'unitprice': row[7]}
-            ingredients.append(ingredient)
-        logger.info(f"Read ingredients from Postgres, Summarizing")
+        ingredients = await inventory.get()
+        logger.info(f"Total number of ingredients in the table: {len(ingredients)}")
+        logger.info(f"Read ingredients from inventory snapshot v{ingredients.version}, Summarizing")
+        if not use_llm:
+            return ingredient_summary.get(ingredients)
 
         # Make summary with Vertex AI
         template = """ 
@@ -334,18 +270,13 @@ def get_ingredient_summary():
         """
 
         prompt = PromptTemplate.from_template(template)
-        chain = prompt | chatbot_llm
 
         # Generate the summary
         try:
-            s =  chain.invoke({'ingredients': json.dumps(ingredients)})
-            try:
-                return json.loads(cleaned(s))
-            except Exception as e:
-                print(e)
-                return cleaned(s)
-
-
+            chatbot_llm = config.get_provider("openai_text")
+            chain = prompt | chatbot_llm
+            return await llm_cache.ainvoke("get_ingredient_summary", "openai_text", chain, {'ingredients': ingredients.json.decode()},
+                                           chatbot_llm, parse=structured_output.parser("get_ingredient_summary"))
         except Exception as e:
             logger.exception(f"An Exception Occurred while generating summary using Vertex AI --> {e}")
             raise HTTPException(status_code=500, detail=str(e))
@@ -359,7 +290,7 @@ def get_ingredient_summary():
 
 
 @router.post("/reengineer_dish", tags=["seller"])
-def reengineer_dish(dish_name: str = Form(...), preferred_cuisine: str = Form(...)):
+async def reengineer_dish(dish_name: str = Form(...), preferred_cuisine: str = Form(...)):
     """
     Reengineer the dish with same ingredients
     :param dish_name:
@@ -372,21 +303,18 @@ def reengineer_dish(dish_name: str = Form(...), preferred_cuisine: str = Form(..
         Constraints: Keep in mind the dish should be {preferred_cuisine} dish and prepration and cook time of new and old dish should be similar.
         Definations: Prep time is the time taken to prepare the dish. Cook time is the time taken to cook the dish."""
     prompt = PromptTemplate.from_template(template)
-    chain = prompt | llm
     try:
-        s = chain.invoke({'dish_name': dish_name, 'preferred_cuisine': preferred_cuisine})
-        try:
-            return json.loads(cleaned(s))
-        except Exception as e:
-            print(e)
-            return cleaned(s)
+        llm = config.get_provider("vertex_ai")
+        chain = prompt | llm
+        return await llm_cache.ainvoke("reengineer_dish", "vertex_ai", chain, {'dish_name': dish_name, 'preferred_cuisine': preferred_cuisine},
+                                       llm, parse=structured_output.parser("reengineer_dish"))
     except Exception as e:
         logger.exception(f"An Exception Occurred while reengineering dish using Vertex AI --> {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/catalog_image_generator")
-def catalog_image_generator(dish_name: str = Form(...), image_type: Optional[str] = Form(None)):
+async def catalog_image_generator(dish_name: str = Form(...), image_type: Optional[str] = Form(None)):
     """
     Generate image for the dish
     :param dish_name:
@@ -399,9 +327,16 @@ def catalog_image_generator(dish_name: str = Form(...), image_type: Optional[str
     Answer: Provide the Prompt 
     """
     prompt = PromptTemplate.from_template(template)
-    chain = LLMChain(prompt=prompt, llm=dalle_llm)
     try:
-        image_url = DallEAPIWrapper().run(chain.run({'dish_name': dish_name, 'image_type': image_type}))
+        dalle_llm = config.get_provider("openai")
+        variables = {'dish_name': dish_name, 'image_type': image_type}
+        key, image_url = llm_cache.lookup("catalog_image_generator", variables, model_params(dalle_llm),
+                                           template)
+        if image_url is None:
+            chain = prompt | dalle_llm
+            image_prompt = await llm_executor.ainvoke("openai", chain, variables)
+            image_url = await llm_executor.run("openai", DallEAPIWrapper().run, image_prompt)
+            llm_cache.store("catalog_image_generator", key, image_url)
         logger.info(f"Image generated successfully")
         return {"image_url": image_url}
     except Exception as e:
@@ -411,21 +346,6 @@ def catalog_image_generator(dish_name: str = Form(...), image_type: Optional[str
 
 @router.post("/get_seller_location", tags=["seller"])
 def get_seller_info(access_token: Annotated[Union[str, None], Header()]):
-    info = Client(access_token=access_token, environment='sandbox')
-    result = info.locations.list_locations()
-    print(result)
-    if result.is_success():
-        square_location_id = result.body['locations'][0]['id']
-        logger.info(f"Connected to Square")
-        return {"location_id":square_location_id}
-    elif result.is_error():
-        for error in result.errors:
-            raise Exception(
-                f"Error connecting to Square --> Category :{error['category']} Code: {error['code']} Detail: {error['detail']}")
-
-
-
-
-
-
-
+    square_client, square_location_id = get_square_connection(access_token)
+    logger.info(f"Connected to Square")
+    return {"location_id":square_location_id}
@@ -1,6 +1,11 @@
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import os
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from square.client import Client
 from google.cloud import aiplatform
 from langchain.llms import VertexAI
@@ -11,6 +16,204 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class ProviderRegistry:
+    """
+    Lazily creates provider clients (Postgres, Vertex AI, Open AI) on first use.
+    Each provider is built at most once, under its own lock, so a slow or unavailable provider only
+    delays the endpoints that use it instead of the whole worker boot.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._errors = {}
+        self._timings = {}
+        self._locks = {}
+
+    def register(self, name, factory):
+        """
+        Register a factory for a provider
+        :param name: Provider name
+        :param factory: Callable returning the provider client
+        """
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        """
+        Return the provider client, creating it on first use
+        :param name: Provider name
+        :return: Provider client
+        """
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._factories:
+            raise Exception(f"Unknown provider --> {name}")
+
+        with self._locks[name]:
+            if name not in self._instances:
+                started = time.monotonic()
+                try:
+                    self._instances[name] = self._factories[name]()
+                    self._errors.pop(name, None)
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                finally:
+                    self._timings[name] = round(time.monotonic() - started, 3)
+        return self._instances[name]
+
+    def reset(self, name):
+        """
+        Drop a provider client so that it is recreated on next use
+        :param name: Provider name
+        """
+        with self._locks[name]:
+            self._instances.pop(name, None)
+
+    def warm_up(self, names=None, background=True):
+        """
+        Create provider clients ahead of the first request
+        :param names: Providers to warm up, defaults to all registered providers
+        :param background: Run in a daemon thread and return immediately
+        :return: The warm up thread when running in background
+        """
+        names = list(names or self._factories)
+
+        def _warm_up():
+            for name in names:
+                try:
+                    self.get(name)
+                    logger.info(f"Provider {name} is ready")
+                except Exception as e:
+                    logger.exception(f"An Exception Occurred while warming up provider {name} --> {e}")
+
+        if not background:
+            _warm_up()
+            return None
+        thread = threading.Thread(target=_warm_up, name="provider-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def readiness(self):
+        """
+        Readiness of every registered provider
+        :return: Dictionary of provider name to {ready, error, init_seconds}
+        """
+        return {name: {'ready': name in self._instances, 'error': self._errors.get(name),
+                       'init_seconds': self._timings.get(name)}
+                for name in self._factories}
+
+
+class PostgresPool:
+    """
+    Thread-safe Postgres connection pool with per-request checkout.
+    Checkout blocks (up to timeout) when all connections are in use, connections idle for longer than
+    health_check_seconds are pinged before being handed out, and broken connections are replaced.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30, health_check_seconds=30):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(min_size, max_size, **connect)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_seconds = health_check_seconds
+        self._stats = {'checkouts': 0, 'in_use': 0, 'peak_in_use': 0, 'waits': 0, 'wait_seconds': 0.0,
+                       'timeouts': 0, 'reconnects': 0}
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.health_check_seconds:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        for _ in range(self.max_size + 1):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            logger.warning(f"Discarding broken Postgres connection, reconnecting")
+            with self._lock:
+                self._stats['reconnects'] += 1
+            self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+        raise Exception("Could not get a healthy Postgres connection from the pool")
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of the block.
+        The transaction is rolled back if the block raises or leaves it open, commit explicitly.
+        :return: psycopg2 connection
+        """
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise Exception(f"Timed out after {self.timeout}s waiting for a Postgres connection")
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._stats['in_use'])
+            self._stats['wait_seconds'] += time.monotonic() - started
+
+        broken = False
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            try:
+                if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            broken = broken or bool(conn.closed)
+            self._last_used[id(conn)] = time.monotonic()
+            if broken:
+                self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=broken)
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def metrics(self):
+        """
+        Pool saturation metrics
+        :return: Dictionary of pool size, usage and wait counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['min_size'] = self.min_size
+        stats['max_size'] = self.max_size
+        stats['saturation'] = round(stats['in_use'] / self.max_size, 3)
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        return stats
+
+    def close(self):
+        self._pool.closeall()
+
+
 class Config:
     _instance = None
 
@@ -35,15 +238,108 @@ class Config:
             self.password = os.environ.get('SUPABASE_DB')
             self.square_access_token = os.environ.get('SQUARE_ACCESS_TOKEN')
             self.square_applicationid = "sandbox-sq0idb-qqw1PDXOq16d403omj_1_g"
+            self.square_base_url = os.environ.get('SQUARE_BASE_URL', "https://connect.squareupsandbox.com")
+            self.square_version = os.environ.get('SQUARE_VERSION', "2023-09-25")
+            self.square_connect_timeout = float(os.environ.get('SQUARE_CONNECT_TIMEOUT', 5))
+            self.square_read_timeout = float(os.environ.get('SQUARE_READ_TIMEOUT', 30))
+            self.square_pool_size = int(os.environ.get('SQUARE_POOL_SIZE', 20))
+            self.square_max_concurrency = int(os.environ.get('SQUARE_MAX_CONCURRENCY', 50))
+            self.square_max_concurrency_per_token = int(os.environ.get('SQUARE_MAX_CONCURRENCY_PER_TOKEN', 10))
+            self.square_max_retries = int(os.environ.get('SQUARE_MAX_RETRIES', 3))
+            self.square_retry_base_delay = float(os.environ.get('SQUARE_RETRY_BASE_DELAY', 0.2))
+            self.square_retry_max_delay = float(os.environ.get('SQUARE_RETRY_MAX_DELAY', 5))
+            self.square_retry_budget_ratio = float(os.environ.get('SQUARE_RETRY_BUDGET_RATIO', 0.2))
+            self.square_rate_limit = float(os.environ.get('SQUARE_RATE_LIMIT', 10))
+            self.square_rate_burst = int(os.environ.get('SQUARE_RATE_BURST', 20))
+            self.square_webhook_signature_key = os.environ.get('SQUARE_WEBHOOK_SIGNATURE_KEY')
+            self.square_webhook_url = os.environ.get('SQUARE_WEBHOOK_URL')
+            self.catalog_cache_ttl = float(os.environ.get('CATALOG_CACHE_TTL', 300))
+            self.catalog_cache_max_stale = float(os.environ.get('CATALOG_CACHE_MAX_STALE', 86400))
+            self.catalog_cache_size = int(os.environ.get('CATALOG_CACHE_SIZE', 256))
+            self.catalog_batch_concurrency = int(os.environ.get('CATALOG_BATCH_CONCURRENCY', 2))
+            self.square_client_cache_ttl = float(os.environ.get('SQUARE_CLIENT_CACHE_TTL', 3600))
+            self.square_client_cache_size = int(os.environ.get('SQUARE_CLIENT_CACHE_SIZE', 128))
             self.gcp_json = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
             self.gcp_project_id = "river-surf-400419"
             self.gcp_location = "us-central1"
             self.gcp_staging_bucket = "gs://river-surf-400419-vertex-ai"
             self.open_ai_key = os.environ.get('OPENAI_API_KEY')
+            # Comma separated providers to warm up in background on startup, "all" for every provider
+            self.warm_up_providers = os.environ.get('WARM_UP_PROVIDERS', '')
+            # Async pool of the ingredient repository, every read and most writes
+            self.postgres_pool_min = int(os.environ.get('POSTGRES_POOL_MIN', 1))
+            self.postgres_pool_max = int(os.environ.get('POSTGRES_POOL_MAX', 10))
+            # psycopg2 pool of the remaining sync writes, /seller/add_ingedients and the COPY import
+            self.postgres_write_pool_min = int(os.environ.get('POSTGRES_WRITE_POOL_MIN', 1))
+            self.postgres_write_pool_max = int(os.environ.get('POSTGRES_WRITE_POOL_MAX', 2))
+            self.postgres_pool_timeout = float(os.environ.get('POSTGRES_POOL_TIMEOUT', 30))
+            self.llm_max_concurrency = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+            # Per provider limits, e.g. vertex_ai=4,openai_chat=8,openai=2
+            self.llm_concurrency = os.environ.get('LLM_CONCURRENCY', '')
+            # memory or sqlite
+            self.llm_cache_backend = os.environ.get('LLM_CACHE_BACKEND', 'memory')
+            self.llm_cache_path = os.environ.get('LLM_CACHE_PATH', 'llm_cache.sqlite3')
+            self.llm_cache_size = int(os.environ.get('LLM_CACHE_SIZE', 1024))
+            self.llm_cache_ttl = float(os.environ.get('LLM_CACHE_TTL', 3600))
+            # Per template TTLs, e.g. recommend_menu=86400,reengineer_dish=86400
+            self.llm_cache_ttls = os.environ.get('LLM_CACHE_TTLS', '')
+            # memory or sqlite
+            self.chat_session_backend = os.environ.get('CHAT_SESSION_BACKEND', 'memory')
+            self.chat_session_path = os.environ.get('CHAT_SESSION_PATH', 'chat_sessions.sqlite3')
+            self.chat_session_size = int(os.environ.get('CHAT_SESSION_SIZE', 10000))
+            self.chat_session_ttl = float(os.environ.get('CHAT_SESSION_TTL', 86400))
+            # Turns kept verbatim, older turns are folded into the summary
+            self.chat_session_turns = int(os.environ.get('CHAT_SESSION_TURNS', 6))
+            self.prompt_context_token_budget = int(os.environ.get('PROMPT_CONTEXT_TOKEN_BUDGET', 1500))
+            self.inventory_snapshot_ttl = float(os.environ.get('INVENTORY_SNAPSHOT_TTL', 60))
 
         except KeyError as e:
             raise Exception("Missing environment variable: {}".format(e))
 
+        self.providers = ProviderRegistry()
+        self.providers.register("postgres", self.get_postgres_pool)
+        self.providers.register("vertex_ai", self.get_vertex_ai_connection)
+        self.providers.register("openai", self.get_open_ai_connection)
+        self.providers.register("openai_text", self.get_openai_text_connection)
+        self.providers.register("openai_chat", self.get_openai_chat_connection)
+
+    def get_provider(self, name):
+        """
+        Return a lazily created provider client
+        :param name: One of postgres, vertex_ai, openai, openai_text, openai_chat
+        :return: Provider client
+        """
+        return self.providers.get(name)
+
+    def warm_up_on_startup(self):
+        """
+        Warm up the providers listed in WARM_UP_PROVIDERS in a background thread
+        :return: The warm up thread, None if nothing to warm up
+        """
+        names = [name.strip() for name in self.warm_up_providers.split(",") if name.strip()]
+        if not names:
+            return None
+        return self.providers.warm_up(None if "all" in names else names)
+
+    def postgres_connection(self):
+        """
+        Check out a pooled Postgres connection, use as `with config.postgres_connection() as conn:`
+        :return: Context manager yielding a psycopg2 connection
+        """
+        return self.get_provider("postgres").connection()
+
+    def get_postgres_pool(self):
+        try:
+            pool = PostgresPool(dict(host=self.host, dbname=self.dbname, user=self.user, password=self.password,
+                                     port=self.port),
+                                min_size=self.postgres_write_pool_min, max_size=self.postgres_write_pool_max,
+                                timeout=self.postgres_pool_timeout)
+            logger.info(f"Connected to Postgres, write pool size {self.postgres_write_pool_min}-"
+                        f"{self.postgres_write_pool_max}")
+            return pool
+        except Exception as e:
+            raise Exception(f"An Exception Occurred while connecting to Postgres --> {e}")
+
     def get_postgres_connection(self):
         try:
             conn = psycopg2.connect(host=self.host, dbname=self.dbname, user=self.user, password=self.password,
@@ -55,7 +351,8 @@ class Config:
 
     def get_square_connection(self):
         logger.info(f"Connecting to Square")
-        square_client = Client(access_token=self.square_access_token, environment='sandbox')
+        square_client = Client(access_token=self.square_access_token, environment='sandbox',
+                               square_version=self.square_version)
         result = square_client.locations.list_locations()
         if result.is_success():
             square_location_id = result.body['locations'][0]['id']
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import math
+import uuid
+
+from .square_catalog import iter_catalog_objects
+from .prompt_context import ZERO_DECIMAL_CURRENCIES
+from .square_gateway import square_gateway, SquareAPIError
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Square accepts at most 1000 objects per batch, nested variations count as objects
+MAX_BATCH_OBJECTS = 1000
+
+
+def menu_items(menu):
+    """
+    Catalog items of a /seller/recommend_menu result, dishes without a price are not published
+    :param menu: {course: {dish: {price, ...}}}, prices in currency units
+    :return: ([{name, price, category}], errors [{items, error}] of the dishes without a price)
+    """
+    if not isinstance(menu, dict):
+        raise ValueError("expected a menu object of courses")
+    items, errors = [], []
+    for course, dishes in menu.items():
+        if not isinstance(dishes, dict):
+            raise ValueError(f"expected an object of dishes for {course}")
+        for dish, details in dishes.items():
+            details = details if isinstance(details, dict) else {'price': details}
+            if details.get('price') is None:
+                errors.append({'items': [dish], 'error': f"unpriced, {details.get('unpriced') or 'no price'}"})
+                continue
+            items.append({'name': dish, 'price': details['price'], 'category': course})
+    return items, errors
+
+
+def to_amount(price, currency):
+    """
+    :param price: Price in currency units, e.g. 12.5
+    :param currency: e.g. CAD
+    :return: Square amount in the smallest currency unit, e.g. 1250
+    :raises ValueError: If the price is not finite
+    """
+    if not math.isfinite(price):
+        raise ValueError(f"not a finite price: {price}")
+    if currency in ZERO_DECIMAL_CURRENCIES:
+        return int(round(price))
+    return int(round(price * 100))
+
+
+def normalize_item(item, currency):
+    """
+    :param item: {name, price, category}, price in currency units
+    :param currency: Currency of the price
+    :return: Item with a stripped name, the price as a Square amount and an optional category
+    """
+    if not isinstance(item, dict) or not str(item.get('name') or "").strip():
+        raise ValueError(f"expected an item with a name: {item}")
+    try:
+        price = to_amount(float(item.get('price')), currency)
+    except (TypeError, ValueError):
+        raise ValueError(f"price of {item['name']} is not a number: {item.get('price')}")
+    if price < 0:
+        raise ValueError(f"price of {item['name']} is negative: {item.get('price')}")
+    category = str(item.get('category') or "").strip() or None
+    return {'name': str(item['name']).strip(), 'price': price, 'category': category}
+
+
+def item_object(item, number, currency, category_id=None):
+    # Same ITEM as /catalog/create, numbered temporary IDs keep duplicate names apart
+    item_data = {
+        "name": item['name'],
+        "abbreviation": item['name'][0:3],
+        "variations": [
+            {
+                "type": "ITEM_VARIATION",
+                "id": f"#item{number}_variation",
+                "item_variation_data": {
+                    "name": "Regular",
+                    "pricing_type": "FIXED_PRICING",
+                    "price_money": {"amount": item['price'], "currency": currency},
+                    "available_for_booking": False
+                }
+            }
+        ]
+    }
+    if category_id:
+        item_data["category_id"] = category_id
+    return {"type": "ITEM", "id": f"#item{number}", "item_data": item_data}
+
+
+def chunk_objects(objects, max_objects=MAX_BATCH_OBJECTS):
+    """
+    Split objects into batches of at most max_objects, counting the nested variations of items
+    :return: List of object lists
+    """
+    chunks, chunk, size = [], [], 0
+    for catalog_object in objects:
+        count = 1 + len(catalog_object.get("item_data", {}).get("variations", []))
+        if chunk and size + count > max_objects:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(catalog_object)
+        size += count
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+async def _upsert(access_token, objects):
+    # One batch-upsert call, the idempotency key makes retries of the gateway safe
+    data = {"idempotency_key": str(uuid.uuid4()), "batches": [{"objects": objects}]}
+    response = await square_gateway.post("/v2/catalog/batch-upsert", access_token, json=data)
+    if response.status_code != 200:
+        raise SquareAPIError(response)
+    return {mapping['client_object_id']: mapping['object_id']
+            for mapping in response.json().get("id_mappings", [])}
+
+
+async def _category_ids(access_token, names):
+    # Reuse categories of the same name, create the missing ones
+    existing = {}
+    async for category in iter_catalog_objects(access_token, types="CATEGORY"):
+        name = category.get("category_data", {}).get("name")
+        if name:
+            existing.setdefault(name.lower(), category["id"])
+    missing = [name for name in names if name.lower() not in existing]
+    if missing:
+        objects = [{"type": "CATEGORY", "id": f"#category{number}", "category_data": {"name": name}}
+                   for number, name in enumerate(missing)]
+        id_mappings = {}
+        for chunk in chunk_objects(objects):
+            id_mappings.update(await _upsert(access_token, chunk))
+        for number, name in enumerate(missing):
+            existing[name.lower()] = id_mappings[f"#category{number}"]
+    return {name: existing[name.lower()] for name in names}
+
+
+async def batch_upsert_items(access_token, items, currency="CAD", concurrency=2):
+    """
+    Upsert many catalog items with batch-upsert calls of up to 1000 objects, sent with bounded concurrency
+    Categories are upserted first so every batch can refer to their real IDs.
+    :param access_token: Seller access token
+    :param items: [{name, price, category}], price in currency units, e.g. 12.5 for 12.50 CAD
+    :param currency: Currency of the prices
+    :param concurrency: batch-upsert calls in flight, Square answers concurrent catalog writes of a seller with 429
+                        and the gateway retries them
+    :return: {items: [{name, category, catalog_object_id, variation_id}], errors: [{items, error}]},
+             failed batches have no IDs and are listed in errors
+    """
+    items = [normalize_item(item, currency) for item in items]
+    categories = await _category_ids(access_token, list(dict.fromkeys(item['category'] for item in items
+                                                                      if item['category'])))
+    objects = [item_object(item, number, currency, categories.get(item['category']))
+               for number, item in enumerate(items)]
+    chunks = chunk_objects(objects)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def upsert(chunk):
+        async with semaphore:
+            return await _upsert(access_token, chunk)
+
+    results = await asyncio.gather(*(upsert(chunk) for chunk in chunks), return_exceptions=True)
+    id_mappings, errors = {}, []
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error in batch upserting {len(chunk)} catalog items -->    {result}")
+            errors.append({'items': [catalog_object["item_data"]["name"] for catalog_object in chunk],
+                           'error': str(result)})
+        else:
+            id_mappings.update(result)
+    logger.info(f"Upserted {len(objects)} catalog items in {len(chunks)} batches, {len(errors)} failed")
+    return {
+        'items': [{'name': item['name'], 'category': item['category'],
+                   'catalog_object_id': id_mappings.get(f"#item{number}"),
+                   'variation_id': id_mappings.get(f"#item{number}_variation")}
+                  for number, item in enumerate(items)],
+        'errors': errors,
+    }
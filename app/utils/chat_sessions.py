@@ -0,0 +1,89 @@
+import asyncio
+import json
+import logging
+import uuid
+import weakref
+from collections import defaultdict
+
+from ..settings.config import Config
+from .llm_cache import MemoryCacheBackend, SQLiteCacheBackend
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+config = Config.get_instance()
+
+
+class ChatSessionStore:
+    """
+    Server-side chat history keyed by session ID.
+    The last max_turns turns are kept verbatim; once twice as many have piled up the older half is folded into a
+    rolling summary, so the prompt holds at most one summary and 2 * max_turns turns however long the chat runs.
+    """
+
+    def __init__(self, backend, ttl=86400, max_turns=6):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self._locks = weakref.WeakValueDictionary()
+        self.counters = defaultdict(int)
+
+    def open(self, session_id=None, history=None):
+        """
+        Load a session, or start one seeded with the history sent by the client
+        :param session_id: Session ID returned by a previous chat
+        :param history: Client history, used when the session is new or expired
+        :return: (session_id, {summary, turns})
+        """
+        session = self.backend.get(session_id) if session_id else None
+        if session is None:
+            self.counters['created'] += 1
+            session_id = session_id or uuid.uuid4().hex
+            session = {"summary": "", "turns": [turn for turn in history or [] if turn]}
+        return session_id, session
+
+    def render(self, session):
+        """
+        Session history for the prompt
+        :return: Summary followed by the recent turns
+        """
+        turns = "".join(turn if isinstance(turn, str) else json.dumps(turn) for turn in session["turns"])
+        if session["summary"]:
+            return f"Summary of earlier conversation: {session['summary']} {turns}"
+        return turns
+
+    async def append(self, session_id, session, message, response, summarize):
+        """
+        Record a turn and fold older turns into the summary when the session is full
+        :param summarize: async (turns, previous_summary) -> summary text or None, without it the fold waits for
+                          a turn that has one, e.g. the next turn answered by the LLM
+        :return: Updated session
+        """
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        async with lock:
+            session = self.backend.get(session_id) or session
+            session["turns"].append({"Customer": message, "Agent": response})
+            if summarize is not None and len(session["turns"]) >= 2 * self.max_turns:
+                older, recent = session["turns"][:-self.max_turns], session["turns"][-self.max_turns:]
+                folded = await summarize(older, session["summary"])
+                if folded:
+                    session = {"summary": folded, "turns": recent}
+                    self.counters['folded'] += 1
+                else:
+                    self.counters['fold_failed'] += 1
+            self.backend.set(session_id, session, self.ttl)
+        return session
+
+    def metrics(self):
+        return {'backend': type(self.backend).__name__, 'sessions': len(self.backend), 'max_turns': self.max_turns,
+                **self.counters}
+
+
+if config.chat_session_backend == "sqlite":
+    _backend = SQLiteCacheBackend(config.chat_session_path, config.chat_session_size, table="chat_sessions")
+else:
+    _backend = MemoryCacheBackend(config.chat_session_size)
+chat_sessions = ChatSessionStore(_backend, config.chat_session_ttl, config.chat_session_turns)
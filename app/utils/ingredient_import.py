@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+import logging
+import re
+
+import psycopg2
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COPY_SQL = """COPY "Ingredients"(ingredient_name,ingredient_type,ingredient_sub_type,shelf_life_days,quantity,units,unitprice)
+              FROM STDIN WITH (FORMAT csv)"""
+REQUIRED = ('ingredient_name', 'ingredient_type', 'ingredient_sub_type', 'shelf_life_days', 'quantity', 'unit')
+DEFAULT_UNIT_PRICE = 2
+MAX_REPORTED_ERRORS = 100
+
+
+class IngredientImportError(Exception):
+    def __init__(self, report):
+        super().__init__(report['errors'][-1]['error'])
+        self.report = report
+
+
+def _number(value):
+    # Integral values are written without a fraction so they also load into integer columns
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def normalize_record(record):
+    """
+    Apply the rules of /seller/add_ingedients to one imported ingredient: lowercase text fields, unitprice defaults to 2
+    :param record: {ingredient_name, ingredient_type, ingredient_sub_type, shelf_life_days, quantity, unit, unitprice}
+    :return: Row in COPY column order
+    :raises ValueError: If a field is missing or not a number
+    """
+    if not isinstance(record, dict):
+        raise ValueError("expected an object")
+    record = {str(key).strip().lower(): value for key, value in record.items()}
+    if 'unit' not in record and 'units' in record:
+        record['unit'] = record['units']
+    missing = [field for field in REQUIRED if record.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    try:
+        shelf_life_days = int(float(record['shelf_life_days']))
+    except (TypeError, ValueError):
+        raise ValueError(f"shelf_life_days is not a number: {record['shelf_life_days']}")
+    try:
+        quantity = _number(record['quantity'])
+    except (TypeError, ValueError):
+        raise ValueError(f"quantity is not a number: {record['quantity']}")
+    unitprice = record.get('unitprice')
+    if unitprice in (None, ""):
+        unitprice = DEFAULT_UNIT_PRICE
+    try:
+        unitprice = _number(unitprice)
+    except (TypeError, ValueError):
+        raise ValueError(f"unitprice is not a number: {unitprice}")
+    return (str(record['ingredient_name']).strip().lower(), str(record['ingredient_type']).strip().lower(),
+            str(record['ingredient_sub_type']).strip().lower(), shelf_life_days, quantity,
+            str(record['unit']).strip().lower(), unitprice)
+
+
+def iter_records(stream, file_format):
+    """
+    Records of an upload or a posted body, CSV rows are read as they stream in
+    :param stream: Text stream
+    :param file_format: csv or json (an array of objects)
+    :return: Iterator of dicts
+    """
+    if file_format == "json":
+        records = json.load(stream)
+        if not isinstance(records, list):
+            raise ValueError("expected a JSON array of ingredients")
+        return iter(records)
+    return csv.DictReader(stream)
+
+
+class _CopyStream:
+    """File-like view of an iterator of CSV lines, COPY pulls rows from it as it reads"""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ""
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            self._buffer = ""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    readline = read
+
+
+def copy_ingredients(conn, records):
+    """
+    Load ingredients with one COPY in one transaction, invalid rows are skipped and reported
+    :param conn: psycopg2 connection
+    :param records: Iterator of ingredient dicts
+    :return: {rows, imported, errors: [{row, error}]}, rows are numbered from 1
+    :raises IngredientImportError: If Postgres rejects the COPY, nothing is imported and the report names the failing row
+    """
+    report = {'rows': 0, 'imported': 0, 'errors': [], 'error_count': 0}
+    copied = []
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def lines():
+        for number, record in enumerate(records, start=1):
+            report['rows'] = number
+            try:
+                row = normalize_record(record)
+            except ValueError as e:
+                report['error_count'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'row': number, 'error': str(e)})
+                continue
+            copied.append(number)
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            yield buffer.getvalue()
+
+    cur = conn.cursor()
+    try:
+        cur.copy_expert(COPY_SQL, _CopyStream(lines()))
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        # Postgres reports the COPY line, map it back to the row of the upload
+        match = re.search(r"line (\d+)", getattr(e.diag, 'context', None) or "")
+        line = int(match.group(1)) if match else None
+        row = copied[line - 1] if line and line <= len(copied) else None
+        raise IngredientImportError({**report, 'imported': 0, 'error_count': report['error_count'] + 1,
+                                     'errors': report['errors'] + [{'row': row, 'error': (e.pgerror or str(e)).strip()}]})
+    report['imported'] = len(copied)
+    return report
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+from decimal import Decimal
+
+import asyncpg
+
+from ..settings.config import Config
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Ingredient JSON key -> column of "Ingredients"
+INGREDIENT_COLUMNS = {'ingredient_id': 'id', 'name': 'ingredient_name', 'quantity': 'quantity', 'unit': 'units',
+                      'shelf_life_days': 'shelf_life_days', 'ingredient_type': 'ingredient_type',
+                      'ingredient_sub_type': 'ingredient_sub_type', 'unitprice': 'unitprice'}
+
+
+def select_list(fields=None):
+    """
+    Column projection of an ingredient query, aliased to the ingredient JSON keys
+    :param fields: Ingredient keys to select, all when None
+    :return: SQL select list, e.g. id AS ingredient_id, ingredient_name AS name
+    :raises ValueError: For unknown fields
+    """
+    fields = fields or list(INGREDIENT_COLUMNS)
+    unknown = [field for field in fields if field not in INGREDIENT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown ingredient fields: {', '.join(unknown)}")
+    return ", ".join(f'{INGREDIENT_COLUMNS[field]} AS {field}' for field in fields)
+
+
+def row_to_ingredient(row):
+    """
+    Map a row of an ingredient query to the ingredient JSON returned by the endpoints
+    :param row: Record selected with select_list()
+    :return: Ingredient dictionary
+    """
+    return dict(row.items())
+
+
+def ingredient_filters(ingredient_type=None, ingredient_sub_type=None, low_stock=None, name_prefix=None, after_id=None):
+    """
+    WHERE clause of an ingredient query, all filters are optional and served by the indexes in migrations/
+    :param ingredient_type:
+    :param ingredient_sub_type:
+    :param low_stock: Only ingredients with quantity at or below it
+    :param name_prefix: Only ingredients whose name starts with it
+    :param after_id: Keyset pagination, only ingredients after this id
+    :return: (SQL condition, arguments)
+    """
+    conditions, args = [], []
+
+    def add(condition, value):
+        args.append(value)
+        conditions.append(condition.format(f"${len(args)}"))
+
+    if ingredient_type:
+        add("ingredient_type = {}", ingredient_type.lower())
+    if ingredient_sub_type:
+        add("ingredient_sub_type = {}", ingredient_sub_type.lower())
+    if low_stock is not None:
+        add("quantity <= {}::numeric", Decimal(str(low_stock)))
+    if name_prefix:
+        # LIKE wildcards in the prefix are matched literally
+        escaped = name_prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        add("ingredient_name LIKE {}", escaped + "%")
+    if after_id is not None:
+        add("id > {}::bigint", int(after_id))
+    return (" AND ".join(conditions) or "TRUE"), args
+
+
+class IngredientRepository:
+    """
+    Async data access for the "Ingredients" table on an asyncpg pool.
+    The pool is created on first use so importing the routers never touches the database.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._pool = None
+        self._lock = None
+        self._error = None
+
+    async def pool(self):
+        """
+        Return the asyncpg pool, creating it on first use
+        :return: asyncpg Pool
+        """
+        if self._pool is not None:
+            return self._pool
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pool is None:
+                try:
+                    self._pool = await asyncpg.create_pool(
+                        host=self.config.host, database=self.config.dbname, user=self.config.user,
+                        password=self.config.password, port=int(self.config.port),
+                        min_size=self.config.postgres_pool_min, max_size=self.config.postgres_pool_max,
+                        timeout=self.config.postgres_pool_timeout)
+                    self._error = None
+                    logger.info(f"Connected to Postgres with async pool")
+                except Exception as e:
+                    self._error = str(e)
+                    raise Exception(f"An Exception Occurred while connecting to Postgres --> {e}")
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def readiness(self):
+        """
+        Readiness of the async pool, in the format of the provider readiness
+        :return: {ready, error, init_seconds}
+        """
+        return {'ready': self._pool is not None, 'error': self._error, 'init_seconds': None}
+
+    def metrics(self):
+        """
+        Async pool size metrics
+        :return: Dictionary of pool size and idle connections, None if the pool is not created yet
+        """
+        if self._pool is None:
+            return None
+        return {'size': self._pool.get_size(), 'idle': self._pool.get_idle_size(),
+                'min_size': self._pool.get_min_size(), 'max_size': self._pool.get_max_size()}
+
+    async def list_ingredients(self, fields=None):
+        """
+        Read all Ingredients
+        :param fields: Ingredient keys to select, all when None
+        :return: List of Ingredients containing {name, quantity, unit, shelf_life_days, ingredient_type, ingredient_sub_type, ingredient_id, unitprice}
+        """
+        pool = await self.pool()
+        rows = await pool.fetch(f""" SELECT {select_list(fields)} FROM "Ingredients" ORDER BY id""")
+        return [row_to_ingredient(row) for row in rows]
+
+    async def query_ingredients(self, limit=100, fields=None, **filters):
+        """
+        One page of Ingredients, keyset paginated on id
+        :param limit: Page size, at least 1
+        :param fields: Ingredient keys to select, all when None
+        :param filters: ingredient_filters() arguments, after_id is the cursor of the previous page
+        :return: (Ingredients, cursor of the next page or None on the last page)
+        """
+        limit = max(1, limit)
+        condition, args = ingredient_filters(**filters)
+        pool = await self.pool()
+        rows = await pool.fetch(f""" SELECT {select_list(fields)}, id AS _cursor FROM "Ingredients"
+                                     WHERE {condition} ORDER BY id LIMIT ${len(args) + 1}""", *args, limit + 1)
+        ingredients = [row_to_ingredient(row) for row in rows[:limit]]
+        next_cursor = rows[limit - 1]['_cursor'] if len(rows) > limit else None
+        for ingredient in ingredients:
+            ingredient.pop('_cursor')
+        return ingredients, next_cursor
+
+    async def export_ingredients(self, fields=None, prefetch=500, **filters):
+        """
+        Stream Ingredients through a server-side cursor, prefetch rows are held in memory at a time
+        :param fields: Ingredient keys to select, all when None
+        :param filters: ingredient_filters() arguments
+        :return: Async generator of Ingredients
+        """
+        condition, args = ingredient_filters(**filters)
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(f""" SELECT {select_list(fields)} FROM "Ingredients"
+                                                  WHERE {condition} ORDER BY id""", *args, prefetch=prefetch):
+                    yield row_to_ingredient(row)
+
+    async def delete_by_name(self, name):
+        """
+        Delete Ingredients by name
+        :param name:
+        :return: Number of deleted rows
+        """
+        pool = await self.pool()
+        status = await pool.execute(""" DELETE FROM "Ingredients" WHERE ingredient_name = $1""", name)
+        return int(status.split()[-1])
+
+    async def update_quantity(self, name, quantity):
+        """
+        Update Ingredients quantity by name
+        :param name:
+        :param quantity:
+        :return: Number of updated rows
+        """
+        pool = await self.pool()
+        status = await pool.execute(""" UPDATE "Ingredients" SET quantity = $1 WHERE ingredient_name = $2""",
+                                    quantity, name)
+        return int(status.split()[-1])
+
+    async def update_quantities(self, ids, names, values, deltas):
+        """
+        Set or adjust many quantities with one set-based UPDATE in one transaction
+        Entry i matches ids[i] when it is not None, else ingredient_name = names[i]; the quantity is set to values[i],
+        or increased by it when deltas[i] is true. Names are resolved to ids first, an entry targeting a row already
+        claimed by an earlier entry, e.g. by id and by name, is not applied.
+        :return: (updated rows {position, ingredient_id, name, before, after},
+                  conflicts {position, ingredient_id, claimed_by}), positions are indexes of the entries
+        """
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                targets = await conn.fetch(
+                    """ SELECT s.position, i.id
+                        FROM unnest($1::bigint[], $2::text[]) WITH ORDINALITY AS s(id, name, position)
+                        JOIN "Ingredients" AS i ON i.id = s.id OR (s.id IS NULL AND i.ingredient_name = s.name)
+                        ORDER BY s.position, i.id
+                        FOR UPDATE OF i""",
+                    ids, names)
+                matched = {}
+                for target in targets:
+                    matched.setdefault(target['position'] - 1, []).append(target['id'])
+                claimed, conflicts = {}, []
+                target_ids, target_values, target_deltas, target_positions = [], [], [], []
+                for position, row_ids in matched.items():
+                    taken = [row_id for row_id in row_ids if row_id in claimed]
+                    if taken:
+                        conflicts.append({'position': position, 'ingredient_id': taken[0],
+                                          'claimed_by': claimed[taken[0]]})
+                        continue
+                    for row_id in row_ids:
+                        claimed[row_id] = position
+                        target_ids.append(row_id)
+                        target_values.append(values[position])
+                        target_deltas.append(deltas[position])
+                        target_positions.append(position)
+                rows = await conn.fetch(
+                    """ UPDATE "Ingredients" AS i
+                        SET quantity = CASE WHEN s.delta THEN i.quantity + s.value ELSE s.value END
+                        FROM unnest($1::bigint[], $2::numeric[], $3::bool[], $4::int[]) AS s(id, value, delta, position),
+                             "Ingredients" AS old
+                        WHERE old.id = i.id AND i.id = s.id
+                        RETURNING s.position, i.id, i.ingredient_name, old.quantity AS before, i.quantity AS after""",
+                    target_ids, target_values, target_deltas, target_positions) if target_ids else []
+        return ([{'position': row['position'], 'ingredient_id': row['id'], 'name': row['ingredient_name'],
+                  'before': row['before'], 'after': row['after']} for row in rows], conflicts)
+
+
+ingredient_repository = IngredientRepository(Config.get_instance())
@@ -0,0 +1,91 @@
+import logging
+import re
+
+import numpy as np
+
+from .units import unit_registry
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Forms of an ingredient grouped with the ingredient itself, e.g. tomato puree with tomato
+FORMS = {'puree', 'paste', 'pulp', 'chopped', 'diced', 'sliced', 'minced', 'crushed', 'fresh', 'whole', 'peeled'}
+
+SINGULAR = [(re.compile(r"ies$"), "y"), (re.compile(r"oes$"), "o"), (re.compile(r"(ch|sh|ss|x)es$"), r"\1"),
+            (re.compile(r"(?<![su])s$"), "")]
+
+
+# Words the suffix rules get wrong, e.g. leaves is not leave and molasses is not a plural
+IRREGULAR = {
+    'leaves': 'leaf', 'loaves': 'loaf', 'halves': 'half', 'knives': 'knife', 'calves': 'calf',
+    'chilies': 'chili', 'chillies': 'chilli', 'cookies': 'cookie', 'brownies': 'brownie', 'smoothies': 'smoothie',
+    'molasses': 'molasses',
+}
+
+
+def singular(word):
+    if word in IRREGULAR:
+        return IRREGULAR[word]
+    if len(word) <= 3:
+        return word
+    for pattern, replacement in SINGULAR:
+        if pattern.search(word):
+            return pattern.sub(replacement, word)
+    return word
+
+
+def normalize_name(name):
+    """
+    Grouping key of an ingredient name: lowercase, singular words and no form words like puree
+    :param name: e.g. "Tomato Puree", "tomatoes"
+    :return: e.g. "tomato"
+    """
+    words = [singular(word) for word in re.findall(r"[a-z0-9]+", str(name or "").lower())]
+    return " ".join(word for word in words if word not in FORMS) or " ".join(words)
+
+
+def summarize_ingredients(ingredients):
+    """
+    Group ingredients by type, normalized name and base unit and sum their quantities
+    :param ingredients: Ingredient mappings with name, quantity, unit and ingredient_type
+    :return: {ingredient_type: [{name, quantity, unit}]}, types and names sorted
+    """
+    if not ingredients:
+        return {}
+    quantities, base_units, _ = unit_registry.convert([ingredient.get('quantity') for ingredient in ingredients],
+                                                      [ingredient.get('unit') for ingredient in ingredients])
+    keys = [(str(ingredient.get('ingredient_type') or 'other').strip(), normalize_name(ingredient.get('name')), base_unit)
+            for ingredient, base_unit in zip(ingredients, base_units)]
+
+    groups = sorted(set(keys))
+    index = {key: position for position, key in enumerate(groups)}
+    inverse = np.fromiter((index[key] for key in keys), dtype=np.int64, count=len(keys))
+    totals = np.bincount(inverse, weights=quantities, minlength=len(groups))
+
+    summary = {}
+    for (ingredient_type, name, base_unit), total in zip(groups, totals.tolist()):
+        quantity, unit = unit_registry.display(total, base_unit)
+        summary.setdefault(ingredient_type, []).append({'name': name.title(), 'quantity': quantity, 'unit': unit})
+    return summary
+
+
+class IngredientSummary:
+    """Deterministic ingredient summary, computed once per inventory snapshot version"""
+
+    def __init__(self):
+        self._version = None
+        self._summary = None
+
+    def get(self, snapshot):
+        """
+        :param snapshot: InventorySnapshot
+        :return: {ingredient_type: [{name, quantity, unit}]}
+        """
+        if self._version != snapshot.version or self._summary is None:
+            self._summary = summarize_ingredients(snapshot.ingredients)
+            self._version = snapshot.version
+        return self._summary
+
+
+ingredient_summary = IngredientSummary()
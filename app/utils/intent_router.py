@@ -0,0 +1,105 @@
+import logging
+import re
+from collections import defaultdict
+
+from .square_catalog import catalog_cache
+from .prompt_context import project_menu
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Intent:
+    """
+    A chat intent answered without Postgres, Square or the LLM.
+    The handler gets (match, message, context) and returns the response, or None to let the LLM answer.
+    stop and payment are the flags of the chat reply, recorded intents are appended to the chat session without
+    folding it, the fold calls the LLM and waits for the next turn the LLM answers.
+    """
+
+    def __init__(self, name, pattern, handler, stop=False, payment=False, record=True):
+        self.name = name
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.handler = handler
+        self.stop = stop
+        self.payment = payment
+        self.record = record
+
+
+class IntentRouter:
+    """Runs registered intents in order before any I/O of a chat turn, the first one that answers wins"""
+
+    def __init__(self):
+        self.intents = []
+        self.counters = defaultdict(int)
+
+    def register(self, name, pattern, stop=False, payment=False, record=True):
+        """
+        Decorator registering a handler for messages matching pattern (case-insensitive)
+        :param name: Intent name
+        :param pattern: Regular expression searched in the message
+        :return: Decorator
+        """
+        def decorator(handler):
+            self.intents.append(Intent(name, pattern, handler, stop, payment, record))
+            return handler
+        return decorator
+
+    def route(self, message, **context):
+        """
+        Answer the message with the first matching intent
+        :param message: Customer message
+        :param context: Passed to the handlers, e.g. access_token
+        :return: (intent, response), (None, None) when the LLM has to answer
+        """
+        for intent in self.intents:
+            match = intent.pattern.search(message)
+            if match is None:
+                continue
+            try:
+                response = intent.handler(match, message, context)
+            except Exception as e:
+                logger.exception(f"An Exception Occurred while answering {intent.name} intent --> {e}")
+                response = None
+            if response is not None:
+                self.counters[intent.name] += 1
+                return intent, response
+        self.counters['llm'] += 1
+        return None, None
+
+    def metrics(self):
+        return {'intents': [intent.name for intent in self.intents], 'routed': dict(self.counters)}
+
+
+intent_router = IntentRouter()
+
+
+@intent_router.register("payment", r"\bpay(?:ment)?\b", stop=True, payment=True, record=False)
+def payment(match, message, context):
+    return "Please pay for your order"
+
+
+@intent_router.register("stop", r"\bstop\b", stop=True, record=False)
+def stop(match, message, context):
+    return "STOPPING CHAT "
+
+
+@intent_router.register("menu", r"^\W*(?:(?:can|could|may) i (?:see|have|get) |(?:show|send|give) (?:me )?|what(?:'s| is) (?:on )?)?"
+                                r"(?:the |your )?menu\W*$")
+def menu(match, message, context):
+    # Only answered from a warm catalog cache, a cold one is left to the LLM path which loads it
+    lines = project_menu(catalog_cache.peek(context['access_token']))
+    if not lines:
+        return None
+    return "Here is our menu: " + "; ".join(lines) + ". What would you like to order?"
+
+
+@intent_router.register("price", r"^\W*(?:how much (?:is|are|does|do|for)|what(?:'s| is) the (?:price|cost) of|price of)\b")
+def price(match, message, context):
+    text = message.lower()
+    lines = [line for line in project_menu(catalog_cache.peek(context['access_token']))
+             if line.split(":", 1)[0].lower() in text]
+    if not lines:
+        return None
+    return "; ".join(lines)
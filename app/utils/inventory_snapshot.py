@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import threading
+import time
+from decimal import Decimal
+from types import MappingProxyType
+
+import orjson
+
+from ..settings.config import Config
+from .ingredient_repository import ingredient_repository
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+config = Config.get_instance()
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+class InventorySnapshot:
+    """
+    Immutable, versioned view of the Ingredients table.
+    ingredients is a tuple of read-only mappings, json is the same list already serialized to JSON bytes.
+    """
+
+    __slots__ = ('version', 'ingredients', 'json', 'loaded_at')
+
+    def __init__(self, version, ingredients, loaded_at=None):
+        ingredients = [dict(ingredient) for ingredient in ingredients]
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'ingredients', tuple(MappingProxyType(ingredient) for ingredient in ingredients))
+        object.__setattr__(self, 'json', orjson.dumps(ingredients, default=_json_default))
+        object.__setattr__(self, 'loaded_at', time.monotonic() if loaded_at is None else loaded_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("InventorySnapshot is immutable")
+
+    def __len__(self):
+        return len(self.ingredients)
+
+
+class InventoryStore:
+    """
+    In-process snapshot of the inventory shared by the chat, menu, summary and ingredient endpoints.
+    Writes through the API patch or invalidate it, the TTL bounds staleness from writes made outside the API.
+    Every snapshot gets a new version, also reads discarded because a write landed meanwhile, so caches keyed on
+    the version never mix them up. Patched snapshots keep the loaded_at of the read they derive from.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._snapshot = None
+        self._version = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._loading = None
+        self.stats = {'hits': 0, 'loads': 0, 'patches': 0, 'invalidations': 0}
+
+    async def get(self):
+        """
+        Current inventory snapshot, loaded from Postgres when missing or expired
+        :return: InventorySnapshot
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl:
+            self.stats['hits'] += 1
+            return snapshot
+        loading = self._loading
+        if loading is None:
+            loading = self._loading = asyncio.ensure_future(self._load())
+            loading.add_done_callback(self._loaded)
+        return await asyncio.shield(loading)
+
+    def _loaded(self, task):
+        if self._loading is task:
+            self._loading = None
+
+    async def _load(self):
+        with self._lock:
+            writes = self._writes
+        ingredients = await ingredient_repository.list_ingredients()
+        self.stats['loads'] += 1
+        with self._lock:
+            self._version += 1
+            snapshot = InventorySnapshot(self._version, ingredients)
+            # A write landed while reading, serve this read but do not keep it
+            if self._writes == writes:
+                self._snapshot = snapshot
+        logger.info(f"Loaded inventory snapshot v{snapshot.version} with {len(snapshot)} ingredients")
+        return snapshot
+
+    def invalidate(self):
+        """
+        Drop the snapshot after a write, thread safe so sync endpoints can call it from the threadpool
+        """
+        with self._lock:
+            self._writes += 1
+            self._snapshot = None
+            # A read in flight started before the write, later reads must not wait for it
+            self._loading = None
+            self.stats['invalidations'] += 1
+
+    def _patch(self, change):
+        with self._lock:
+            self._writes += 1
+            self._loading = None
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            self._version += 1
+            self._snapshot = InventorySnapshot(self._version, change(snapshot.ingredients), snapshot.loaded_at)
+            self.stats['patches'] += 1
+
+    def patch_quantity(self, name, quantity):
+        """
+        Update the quantity of ingredients by name without reloading the table
+        :param name:
+        :param quantity:
+        """
+        self._patch(lambda ingredients: [{**ingredient, 'quantity': quantity} if ingredient['name'] == name
+                                         else ingredient for ingredient in ingredients])
+
+    def patch_quantities(self, quantities):
+        """
+        Update the quantity of many ingredients by ingredient_id in one pass
+        :param quantities: {ingredient_id: quantity}
+        """
+        self._patch(lambda ingredients: [{**ingredient, 'quantity': quantities[ingredient['ingredient_id']]}
+                                         if ingredient['ingredient_id'] in quantities else ingredient
+                                         for ingredient in ingredients])
+
+    def patch_delete(self, name):
+        """
+        Remove ingredients by name without reloading the table
+        :param name:
+        """
+        self._patch(lambda ingredients: [ingredient for ingredient in ingredients if ingredient['name'] != name])
+
+    def metrics(self):
+        snapshot = self._snapshot
+        return {**self.stats, 'version': self._version, 'size': len(snapshot) if snapshot is not None else None}
+
+
+inventory = InventoryStore(config.inventory_snapshot_ttl)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from ..settings.config import Config
+from .llm_executor import llm_executor
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+config = Config.get_instance()
+
+# Generated image URLs expire after an hour, keep them for less
+DEFAULT_TEMPLATE_TTLS = {'catalog_image_generator': 3000}
+
+
+class MemoryCacheBackend:
+    """In-memory LRU with expiry"""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk cache shared by the workers of a host, least recently used rows are evicted past max_size"""
+
+    def __init__(self, path, max_size=10000, table="llm_cache"):
+        self.max_size = max_size
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"""CREATE TABLE IF NOT EXISTS {table}
+                               (key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)""")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                               (key, json.dumps(value), now + ttl, now))
+            self._conn.execute(f"""DELETE FROM {self.table} WHERE key IN
+                                   (SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+                               (self.max_size,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def model_params(llm):
+    """
+    Parameters that change the output of a model, e.g. model name and temperature
+    :param llm: Langchain LLM
+    :return: Dictionary of parameters
+    """
+    try:
+        return dict(llm._identifying_params)
+    except Exception:
+        return {'llm': type(llm).__name__}
+
+
+def template_text(chain):
+    """
+    Text of the prompt template a chain starts with
+    :param chain: Runnable prompt | llm
+    :return: Template text, None if the chain does not start with a prompt template
+    """
+    return getattr(getattr(chain, 'first', chain), 'template', None)
+
+
+class LLMCache:
+    """
+    Response cache in front of LLM calls.
+    Keys are a hash of the template ID and text, the rendered variables and the model parameters, so rewording a
+    template does not serve responses of the old wording; TTLs are per template.
+    """
+
+    def __init__(self, backend, ttl=3600, template_ttls=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.template_ttls = {**DEFAULT_TEMPLATE_TTLS, **(template_ttls or {})}
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def key(self, template_id, variables, params=None, template=None):
+        payload = json.dumps([template_id, template, variables, params or {}], sort_keys=True, default=str)
+        return template_id + ":" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, template_id, variables, params=None, template=None):
+        """
+        Look up a cached response
+        :param template_id: Prompt template name
+        :param variables: Variables rendered into the template
+        :param params: Model parameters
+        :param template: Template text
+        :return: (key, cached response or None)
+        """
+        key = self.key(template_id, variables, params, template)
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.exception(f"An Exception Occurred while reading LLM cache --> {e}")
+            value = None
+        if value is None:
+            self.misses[template_id] += 1
+        else:
+            self.hits[template_id] += 1
+        return key, value
+
+    def store(self, template_id, key, value):
+        ttl = self.template_ttls.get(template_id, self.ttl)
+        if value is None or ttl <= 0:
+            return
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            logger.exception(f"An Exception Occurred while writing LLM cache --> {e}")
+
+    async def ainvoke(self, template_id, provider, chain, variables, llm=None, parse=None):
+        """
+        chain.ainvoke(variables) through the cache, misses run on the LLM executor
+        :param template_id: Prompt template name
+        :param provider: Provider name of the chain LLM, e.g. vertex_ai
+        :param chain: Runnable prompt | llm
+        :param variables: Template variables
+        :param llm: LLM of the chain, its parameters are part of the key
+        :param parse: Optional parser of the output, outputs it rejects are not cached
+        :return: LLM output, parsed if parse is given
+        """
+        key, value = self.lookup(template_id, variables, model_params(llm) if llm is not None else None,
+                                 template_text(chain))
+        if value is not None and parse is not None:
+            try:
+                return parse(value)
+            except ValueError:
+                value = None
+        if value is None:
+            value = await llm_executor.ainvoke(provider, chain, variables)
+            parsed = parse(value) if parse is not None else value
+            self.store(template_id, key, value)
+            return parsed
+        return value
+
+    def metrics(self):
+        templates = set(self.hits) | set(self.misses)
+        return {'backend': type(self.backend).__name__, 'size': len(self.backend),
+                'templates': {template: {'hits': self.hits[template], 'misses': self.misses[template]}
+                              for template in templates}}
+
+
+def _template_ttls(value):
+    ttls = {}
+    for pair in (value or "").split(","):
+        if "=" in pair:
+            template_id, ttl = pair.split("=", 1)
+            ttls[template_id.strip()] = float(ttl)
+    return ttls
+
+
+if config.llm_cache_backend == "sqlite":
+    _backend = SQLiteCacheBackend(config.llm_cache_path, config.llm_cache_size)
+else:
+    _backend = MemoryCacheBackend(config.llm_cache_size)
+llm_cache = LLMCache(_backend, config.llm_cache_ttl, _template_ttls(config.llm_cache_ttls))
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from ..settings.config import Config
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+config = Config.get_instance()
+
+
+class LLMExecutor:
+    """
+    Runs LLM calls with ainvoke/astream on the event loop, with a separate concurrency limit per provider.
+    A burst of slow generations on one provider waits for its own slots and never holds a threadpool thread
+    needed by the Square and Postgres endpoints.
+    """
+
+    def __init__(self, default_limit=4, limits=None):
+        self.default_limit = default_limit
+        self.limits = dict(limits or {})
+        self._semaphores = {}
+        self._in_flight = defaultdict(int)
+        self._waiting = defaultdict(int)
+        self._calls = defaultdict(int)
+        self._seconds = defaultdict(float)
+
+    def _semaphore(self, provider):
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limits.get(provider, self.default_limit))
+            self._semaphores[provider] = semaphore
+        return semaphore
+
+    async def _acquire(self, provider):
+        semaphore = self._semaphore(provider)
+        self._waiting[provider] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[provider] -= 1
+        self._in_flight[provider] += 1
+        self._calls[provider] += 1
+        return semaphore, time.monotonic()
+
+    def _release(self, provider, semaphore, started):
+        self._in_flight[provider] -= 1
+        self._seconds[provider] += time.monotonic() - started
+        semaphore.release()
+
+    async def ainvoke(self, provider, chain, variables):
+        """
+        await chain.ainvoke(variables) within the provider limit
+        :param provider: Provider name, e.g. vertex_ai, openai_chat
+        :param chain: Runnable prompt | llm
+        :param variables: Template variables
+        :return: LLM output
+        """
+        semaphore, started = await self._acquire(provider)
+        try:
+            return await chain.ainvoke(variables)
+        finally:
+            self._release(provider, semaphore, started)
+
+    async def astream(self, provider, chain, variables):
+        """
+        Stream chain.astream(variables) within the provider limit, the slot is held until the stream ends
+        :return: Async generator of tokens
+        """
+        semaphore, started = await self._acquire(provider)
+        try:
+            async for token in chain.astream(variables):
+                yield token
+        finally:
+            self._release(provider, semaphore, started)
+
+    async def run(self, provider, func, *args):
+        """
+        Run a blocking provider call without an async API (e.g. DALL-E) in the default executor, within the provider limit
+        :return: Result of func(*args)
+        """
+        semaphore, started = await self._acquire(provider)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+        finally:
+            self._release(provider, semaphore, started)
+
+    def metrics(self):
+        providers = set(self._calls) | set(self._waiting)
+        return {provider: {'limit': self.limits.get(provider, self.default_limit),
+                           'in_flight': self._in_flight[provider], 'waiting': self._waiting[provider],
+                           'calls': self._calls[provider], 'seconds': round(self._seconds[provider], 3)}
+                for provider in providers}
+
+
+def _limits(value):
+    limits = {}
+    for pair in (value or "").split(","):
+        if "=" in pair:
+            provider, limit = pair.split("=", 1)
+            limits[provider.strip()] = int(limit)
+    return limits
+
+
+llm_executor = LLMExecutor(config.llm_max_concurrency, _limits(config.llm_concurrency))
@@ -0,0 +1,110 @@
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from .ingredient_summary import normalize_name
+from .units import unit_registry
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Unit price of rows without one, per unit of the row like /seller/add_ingedients
+DEFAULT_UNIT_PRICE = 2.0
+
+
+class PriceEngine:
+    """
+    Prices dishes from their bill of materials and the unit prices of the Ingredients table:
+    Price = (cost + 30% + 5%) + 10% tax, where cost is the sum of quantity * unit price of the ingredients.
+    All ingredient lines of a menu are converted and priced together with one bincount per menu.
+    Dishes that can not be costed, e.g. an ingredient missing from the table, are marked unpriced with the reason.
+    """
+
+    def __init__(self, margin=0.35, tax=0.10, max_entries=16):
+        self.margin = margin
+        self.tax = tax
+        self.max_entries = max_entries
+        self._prices = OrderedDict()
+
+    def unit_prices(self, snapshot):
+        """
+        Price per base unit of each ingredient, cached per inventory snapshot version
+        :param snapshot: InventorySnapshot
+        :return: {normalized name: {base unit: price per base unit}}, the first row of a name in each base unit, so
+                 a row whose unit does not convert does not hide a later row of the same name that does
+        """
+        prices = self._prices.get(snapshot.version)
+        if prices is not None:
+            return prices
+        ingredients = snapshot.ingredients
+        factors, base_units, _ = unit_registry.convert(np.ones(len(ingredients)), [i.get('unit') for i in ingredients])
+        unit_prices = np.asarray([_price(i.get('unitprice')) for i in ingredients], dtype=float)
+        per_base = unit_prices / np.where(factors > 0, factors, 1.0)
+        prices = {}
+        for ingredient, base, price in zip(ingredients, base_units, per_base.tolist()):
+            prices.setdefault(normalize_name(ingredient.get('name')), {}).setdefault(base, price)
+        self._prices[snapshot.version] = prices
+        while len(self._prices) > self.max_entries:
+            self._prices.popitem(last=False)
+        return prices
+
+    def price_menu(self, menu, snapshot):
+        """
+        Fill in the price of every dish of a menu
+        :param menu: {course: {dish: {ingredients: [{name, quantity, unit}], ...}}}
+        :param snapshot: InventorySnapshot with the unit prices
+        :return: The menu with price and cost set on every dish that can be costed, the others get price None and
+                 unpriced with the reason, e.g. "no unit price for saffron"
+        """
+        prices = self.unit_prices(snapshot)
+        dishes, dish_index, names, quantities, units = [], [], [], [], []
+        for course in menu.values():
+            for details in course.values():
+                for ingredient in details.get('ingredients') or []:
+                    dish_index.append(len(dishes))
+                    names.append(normalize_name(ingredient.get('name')))
+                    quantities.append(ingredient.get('quantity'))
+                    units.append(ingredient.get('unit'))
+                dishes.append(details)
+        if not dishes:
+            return menu
+
+        reasons = [[] for _ in dishes]
+        costs = np.zeros(len(names))
+        if names:
+            base_quantities, base_units, _ = unit_registry.convert(quantities, units)
+            entries = [prices.get(name) for name in names]
+            per_base = np.asarray([entry.get(base, 0.0) if entry is not None else 0.0
+                                   for entry, base in zip(entries, base_units)])
+            costs = base_quantities * per_base
+            for position, (entry, base) in enumerate(zip(entries, base_units)):
+                if entry is None:
+                    reasons[dish_index[position]].append(f"no unit price for {names[position]}")
+                elif base not in entry:
+                    reasons[dish_index[position]].append(f"{units[position]} of {names[position]} does not convert "
+                                                         f"to {', '.join(entry)}")
+        dish_costs = np.bincount(np.asarray(dish_index, dtype=np.int64), weights=costs, minlength=len(dishes))
+        dish_prices = np.round(dish_costs * (1 + self.margin) * (1 + self.tax), 2)
+        for details, cost, price, reason in zip(dishes, np.round(dish_costs, 2).tolist(), dish_prices.tolist(),
+                                                reasons):
+            if not details.get('ingredients'):
+                reason = ["no ingredients"]
+            if reason:
+                details['price'] = None
+                details['unpriced'] = ", ".join(reason)
+            else:
+                details['cost'] = cost
+                details['price'] = price
+        return menu
+
+
+def _price(value):
+    try:
+        return float(value) if value is not None else DEFAULT_UNIT_PRICE
+    except (TypeError, ValueError):
+        return DEFAULT_UNIT_PRICE
+
+
+price_engine = PriceEngine()
@@ -0,0 +1,160 @@
+import logging
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from ..settings.config import Config
+from .units import unit_registry
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+config = Config.get_instance()
+
+
+def estimate_tokens(text):
+    """
+    Rough token count, about 4 characters per token for English text
+    :param text:
+    :return: Estimated tokens
+    """
+    return math.ceil(len(text) / 4)
+
+
+def _format_quantity(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return str(int(value)) if value.is_integer() else f"{value:g}"
+
+
+# Currencies whose Square amounts are whole units, amounts of the others are in cents
+ZERO_DECIMAL_CURRENCIES = {'JPY', 'KRW', 'VND', 'CLP', 'ISK'}
+
+
+def format_money(price_money):
+    """
+    Square money as customers read it
+    :param price_money: {amount, currency}, amount in the smallest currency unit
+    :return: e.g. "12.00 CAD" for an amount of 1200
+    """
+    currency = price_money.get('currency') or ''
+    amount = price_money.get('amount') or 0
+    if currency in ZERO_DECIMAL_CURRENCIES:
+        return f"{amount} {currency}".strip()
+    return f"{amount / 100:.2f} {currency}".strip()
+
+
+def project_menu(catalog):
+    """
+    Project Square catalog ITEM objects to one line per dish with its variations and prices
+    :param catalog: {"objects": [...]} from the Square catalog
+    :return: List of lines, e.g. "Butter Chicken: Regular 12.00 CAD, Large 18.00 CAD", dishes without a price are left out
+    """
+    lines = []
+    for catalog_object in (catalog or {}).get("objects", []):
+        item_data = catalog_object.get("item_data")
+        if catalog_object.get("is_deleted") or not item_data:
+            continue
+        prices = []
+        for variation in item_data.get("variations", []):
+            variation_data = variation.get("item_variation_data", {})
+            price_money = variation_data.get("price_money")
+            if not price_money or price_money.get('amount') is None:
+                continue
+            price = format_money(price_money)
+            name = variation_data.get("name")
+            prices.append(f"{name} {price}" if name and name != item_data.get("name") else price)
+        if prices:
+            lines.append(f"{item_data.get('name')}: {', '.join(prices)}")
+    return lines
+
+
+def project_ingredients(ingredients):
+    """
+    Project ingredients to name, quantity and unit in canonical units, ingredients in stock first and by quantity
+    :param ingredients: Ingredient mappings, e.g. InventorySnapshot.ingredients
+    :return: List of lines, e.g. "tomato: 5 kg"
+    """
+    ingredients = list(ingredients or [])
+    if not ingredients:
+        return []
+    quantities, base_units, _ = unit_registry.convert([ingredient.get("quantity") for ingredient in ingredients],
+                                                      [ingredient.get("unit") for ingredient in ingredients])
+    lines = []
+    for position in np.argsort(-quantities, kind="stable"):
+        quantity, unit = unit_registry.display(float(quantities[position]), base_units[position])
+        lines.append(f"{ingredients[position].get('name')}: {_format_quantity(quantity)} {unit}".strip())
+    return lines
+
+
+def fit_to_budget(lines, budget):
+    """
+    Keep the leading lines that fit in the token budget
+    :param lines: Ranked lines, most relevant first
+    :param budget: Token budget
+    :return: Text with one line per entry, and a count of dropped entries when truncated
+    """
+    kept, used = [], 0
+    for index, line in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            kept.append(f"... and {len(lines) - index} more")
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+class PromptContextBuilder:
+    """
+    Builds the compact menu and ingredient context of the chat prompt within a token budget.
+    Projections are cached per catalog object and inventory snapshot version, so they are rebuilt only
+    when the cached catalog or the inventory changes.
+    """
+
+    def __init__(self, token_budget=1500, menu_share=0.6, max_entries=128):
+        self.token_budget = token_budget
+        self.menu_share = menu_share
+        self.max_entries = max_entries
+        self._menus = OrderedDict()
+        self._ingredients = OrderedDict()
+
+    def _cached(self, cache, key, source, build):
+        entry = cache.get(key)
+        if entry is not None and entry[0] is source:
+            cache.move_to_end(key)
+            return entry[1]
+        text = build()
+        cache[key] = (source, text)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+        return text
+
+    def menu(self, catalog):
+        """
+        Compact menu text
+        :param catalog: {"objects": [...]} from the Square catalog
+        :return: Menu text within the menu share of the budget
+        """
+        budget = int(self.token_budget * self.menu_share)
+        return self._cached(self._menus, id(catalog), catalog,
+                            lambda: fit_to_budget(project_menu(catalog), budget))
+
+    def ingredients(self, snapshot):
+        """
+        Compact ingredient text
+        :param snapshot: InventorySnapshot
+        :return: Ingredient text within the ingredient share of the budget
+        """
+        if snapshot is None:
+            return ""
+        budget = self.token_budget - int(self.token_budget * self.menu_share)
+        return self._cached(self._ingredients, snapshot.version, snapshot,
+                            lambda: fit_to_budget(project_ingredients(snapshot.ingredients), budget))
+
+
+prompt_context = PromptContextBuilder(config.prompt_context_token_budget)
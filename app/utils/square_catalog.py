@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..settings.config import Config
+from .square_gateway import square_gateway
+from .square_payments import get_square_locations, token_key
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+config = Config.get_instance()
+
+
+async def iter_catalog_objects(access_token, types="ITEM"):
+    """
+    Yield catalog objects page by page, following cursors until the catalog is exhausted
+    :param access_token: Seller access token
+    :param types: Catalog object types, DEFAULT MENU TYPE IS ITEM
+    :return: Async generator of catalog objects
+    """
+    async for page in square_gateway.paginate("/v2/catalog/list", access_token, params={"types": types}):
+        for catalog_object in page.get("objects", []):
+            yield catalog_object
+
+
+async def list_catalog(access_token, types="ITEM"):
+    """
+    Read the whole catalog
+    :param access_token: Seller access token
+    :param types: Catalog object types
+    :return: {"objects": [...]} with the objects of every page
+    """
+    objects = [catalog_object async for catalog_object in iter_catalog_objects(access_token, types)]
+    logger.info(f"Read {len(objects)} catalog objects from Square")
+    return {"objects": objects}
+
+
+class CatalogCache:
+    """
+    In-memory catalog per seller, keyed by a hash of the access token.
+    Fresh entries are served from memory, stale entries are served while a background task refreshes them,
+    and entries are invalidated when the catalog is changed through the API or by a Square webhook.
+    """
+
+    def __init__(self, ttl=300, max_stale=86400, max_size=256):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._generations = {}
+        self._merchants = {}
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'invalidations': 0}
+
+    async def get(self, access_token):
+        """
+        Catalog of the seller, from memory when possible
+        :param access_token: Seller access token
+        :return: {"objects": [...]}
+        """
+        key = token_key(access_token)
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry['fetched_at']
+            if age < self.ttl and not entry['stale']:
+                self.stats['hits'] += 1
+                self._entries.move_to_end(key)
+                return entry['catalog']
+            if age < self.max_stale:
+                self.stats['stale_hits'] += 1
+                self._refresh_in_background(key, access_token)
+                return entry['catalog']
+        self.stats['misses'] += 1
+        return await self._load(key, access_token)
+
+    def peek(self, access_token):
+        """
+        Cached catalog without any Square call, even if stale
+        :param access_token: Seller access token
+        :return: {"objects": [...]}, None if the seller catalog is not cached
+        """
+        entry = self._entries.get(token_key(access_token))
+        return entry['catalog'] if entry is not None else None
+
+    async def _load(self, key, access_token):
+        # Single flight, concurrent misses of the same seller wait for one Square read
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, access_token))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None) if self._loading.get(key) is task else None)
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, access_token):
+        generation = self._generations.get(key, 0)
+        catalog = await list_catalog(access_token)
+        # The catalog changed while reading, serve this read but do not keep it
+        if self._generations.get(key, 0) != generation:
+            return catalog
+        self._entries[key] = {'catalog': catalog, 'fetched_at': time.monotonic(), 'stale': False,
+                              'access_token': access_token}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        if key not in self._merchants.values():
+            asyncio.ensure_future(self._resolve_merchant(key, access_token))
+        return catalog
+
+    async def _resolve_merchant(self, key, access_token):
+        # Webhooks only carry the merchant id, map it to the cached seller
+        try:
+            square_client, locations = await run_in_threadpool(get_square_locations, access_token)
+            for location in locations:
+                self._merchants[location['merchant_id']] = key
+        except Exception as e:
+            logger.warning(f"Could not resolve merchant of cached catalog --> {e}")
+
+    def _refresh_in_background(self, key, access_token):
+        if key in self._loading:
+            return
+        self.stats['refreshes'] += 1
+        task = self._load(key, access_token)
+
+        async def _refresh():
+            try:
+                await task
+                logger.info(f"Refreshed cached catalog")
+            except Exception as e:
+                logger.exception(f"An Exception Occurred while refreshing cached catalog --> {e}")
+
+        asyncio.ensure_future(_refresh())
+
+    def invalidate(self, access_token, refresh=True):
+        """
+        Invalidate the seller catalog after it changed
+        :param access_token: Seller access token
+        :param refresh: Reload it in background so the next read is served from memory
+        """
+        key = token_key(access_token)
+        self.stats['invalidations'] += 1
+        self._generations[key] = self._generations.get(key, 0) + 1
+        # A read in flight started before the write, later reads must not wait for it
+        self._loading.pop(key, None)
+        if self._entries.pop(key, None) is not None and refresh:
+            self._refresh_in_background(key, access_token)
+
+    def invalidate_merchant(self, merchant_id):
+        """
+        Mark the catalog of a merchant stale, e.g. on a catalog.version.updated webhook
+        :param merchant_id: Square merchant id, unknown merchants are ignored and expire with the TTL
+        :return: Number of invalidated catalogs
+        """
+        key = self._merchants.get(merchant_id)
+        invalidated = 0
+        if key is not None:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._loading.pop(key, None)
+                entry['stale'] = True
+                self._refresh_in_background(key, entry['access_token'])
+                invalidated += 1
+        self.stats['invalidations'] += invalidated
+        return invalidated
+
+    def metrics(self):
+        return {**self.stats, 'size': len(self._entries), 'ttl': self.ttl}
+
+
+catalog_cache = CatalogCache(config.catalog_cache_ttl, config.catalog_cache_max_stale, config.catalog_cache_size)
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import logging
+import weakref
+
+import httpx
+import orjson
+from fastapi.responses import Response
+
+from ..settings.config import Config
+from .square_retry import RetryPolicy, RetryBudget, TokenBucketLimiter, endpoint_key
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SquareAPIError(Exception):
+    """Raised by the gateway helpers when Square answers with a non 200 status"""
+
+    def __init__(self, response):
+        self.response = response
+        super().__init__(error_detail(response))
+
+
+class SquareGateway:
+    """
+    Single entry point for Square REST calls.
+    Keeps one async keep-alive connection pool to Square, sets the Square-Version header, applies
+    connect/read timeouts and bounds the number of in-flight calls globally and per access token.
+    Calls are throttled per access token and 429/5xx responses are retried with jittered backoff
+    within a retry budget per endpoint.
+    """
+
+    def __init__(self, config):
+        self.base_url = config.square_base_url
+        self.square_version = config.square_version
+        self.timeout = httpx.Timeout(config.square_read_timeout, connect=config.square_connect_timeout)
+        self.limits = httpx.Limits(max_connections=config.square_pool_size,
+                                   max_keepalive_connections=config.square_pool_size)
+        self.max_concurrency = config.square_max_concurrency
+        self.max_concurrency_per_token = config.square_max_concurrency_per_token
+        self._client = None
+        self._semaphore = None
+        self._token_semaphores = weakref.WeakValueDictionary()
+        self._in_flight = 0
+        self.retry_policy = RetryPolicy(config.square_max_retries, config.square_retry_base_delay,
+                                        config.square_retry_max_delay)
+        self.retry_budget = RetryBudget(config.square_retry_budget_ratio)
+        self.rate_limiter = TokenBucketLimiter(config.square_rate_limit, config.square_rate_burst)
+
+    def client(self):
+        """
+        Return the shared httpx client, created on first use inside the running event loop
+        :return: httpx AsyncClient
+        """
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _token_semaphore(self, access_token):
+        key = hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+        semaphore = self._token_semaphores.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency_per_token)
+            self._token_semaphores[key] = semaphore
+        return semaphore
+
+    def headers(self, access_token):
+        """
+        Headers for a Square call
+        :param access_token: Seller access token
+        :return: Headers dictionary
+        """
+        return {
+            "Square-Version": self.square_version,
+            "Authorization": "Bearer " + access_token,
+        }
+
+    async def _send(self, method, path, access_token, **kwargs):
+        client = self.client()
+        token_semaphore = self._token_semaphore(access_token)
+        async with self._semaphore, token_semaphore:
+            self._in_flight += 1
+            try:
+                return await client.request(method, path, headers=self.headers(access_token), **kwargs)
+            finally:
+                self._in_flight -= 1
+
+    async def request(self, method, path, access_token, **kwargs):
+        """
+        Call Square REST API, retrying rate limited and failed calls
+        :param method: HTTP method
+        :param path: API path, e.g. /v2/catalog/list
+        :param access_token: Seller access token
+        :param kwargs: Passed to httpx, e.g. json, params, files
+        :return: httpx Response, the last one if retries are exhausted
+        """
+        endpoint = endpoint_key(method, path)
+        idempotent = method != "POST" or "idempotency_key" in (kwargs.get("json") or {})
+        self.retry_budget.record_call(endpoint)
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire(access_token)
+            response, error = None, None
+            try:
+                response = await self._send(method, path, access_token, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            delay = self.retry_policy.delay(attempt, response, error, idempotent)
+            if delay is None or not self.retry_budget.try_spend(endpoint):
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            logger.warning(f"Retrying {endpoint} in {delay:.2f}s, attempt {attempt} --> "
+                           f"{error or response.status_code}")
+            await asyncio.sleep(delay)
+
+    async def get(self, path, access_token, **kwargs):
+        return await self.request("GET", path, access_token, **kwargs)
+
+    async def post(self, path, access_token, **kwargs):
+        return await self.request("POST", path, access_token, **kwargs)
+
+    async def put(self, path, access_token, **kwargs):
+        return await self.request("PUT", path, access_token, **kwargs)
+
+    async def delete(self, path, access_token, **kwargs):
+        return await self.request("DELETE", path, access_token, **kwargs)
+
+    async def paginate(self, path, access_token, params=None):
+        """
+        Follow Square cursors and yield every page of a list endpoint
+        :param path: API path, e.g. /v2/catalog/list
+        :param access_token: Seller access token
+        :param params: Query parameters of the first page
+        :return: Async generator of page bodies
+        """
+        params = dict(params or {})
+        while True:
+            response = await self.get(path, access_token, params=params)
+            if response.status_code != 200:
+                raise SquareAPIError(response)
+            page = orjson.loads(response.content)
+            yield page
+            if not page.get("cursor"):
+                return
+            params["cursor"] = page["cursor"]
+
+    async def download(self, url):
+        """
+        Download a file outside Square, e.g. a generated dish image, on the shared client
+        :param url: Absolute URL
+        :return: httpx Response
+        """
+        return await self.client().get(url, follow_redirects=True)
+
+    def metrics(self):
+        """
+        Concurrency metrics
+        :return: Dictionary of in-flight calls and limits
+        """
+        return {'in_flight': self._in_flight, 'max_concurrency': self.max_concurrency,
+                'max_concurrency_per_token': self.max_concurrency_per_token,
+                'active_tokens': len(self._token_semaphores),
+                'throttled': self.rate_limiter.throttled,
+                'throttled_seconds': round(self.rate_limiter.throttled_seconds, 3),
+                'retries': dict(self.retry_budget.retries),
+                'retry_budget_exhausted': dict(self.retry_budget.exhausted)}
+
+
+def error_detail(response):
+    """
+    Error detail of a failed Square call, the JSON errors or the raw body
+    :param response: httpx Response
+    :return: Error detail string
+    """
+    try:
+        return str(response.json())
+    except ValueError:
+        return f"{response.status_code} {response.text}"
+
+
+def json_response(response):
+    """
+    Answer with the JSON body of a Square call as is, without decoding and encoding it again
+    :param response: httpx Response
+    :return: Response with the raw body
+    """
+    return Response(content=response.content, media_type="application/json")
+
+
+square_gateway = SquareGateway(Config.get_instance())
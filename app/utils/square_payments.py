@@ -1,12 +1,79 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
 from square.client import Client
 
-def get_square_connection(access_token):
-    square_client = Client(access_token, environment='sandbox')
+from ..settings.config import Config
+
+config = Config.get_instance()
+
+# token hash -> (expires_at, square_client, locations)
+_connections = OrderedDict()
+_lock = threading.Lock()
+
+
+def token_key(access_token):
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+def _connect(access_token):
+    square_client = Client(access_token=access_token, environment='sandbox', square_version=config.square_version)
     result = square_client.locations.list_locations()
     if result.is_success():
-        square_location_id = result.body['locations'][0]['id']
-        return square_client, square_location_id
+        return square_client, result.body['locations']
     elif result.is_error():
         for error in result.errors:
             raise Exception(
                 f"Error connecting to Square --> Category :{error['category']} Code: {error['code']} Detail: {error['detail']}")
+
+
+def get_square_locations(access_token):
+    """
+    Square client and locations for an access token, cached per token with TTL and LRU eviction
+    :param access_token: Seller access token
+    :return: (square_client, locations)
+    """
+    key = token_key(access_token)
+    now = time.monotonic()
+    with _lock:
+        cached = _connections.get(key)
+        if cached is not None and cached[0] > now:
+            _connections.move_to_end(key)
+            return cached[1], cached[2]
+
+    square_client, locations = _connect(access_token)
+    with _lock:
+        _connections[key] = (now + config.square_client_cache_ttl, square_client, locations)
+        _connections.move_to_end(key)
+        while len(_connections) > config.square_client_cache_size:
+            _connections.popitem(last=False)
+    return square_client, locations
+
+
+def get_square_connection(access_token):
+    square_client, locations = get_square_locations(access_token)
+    return square_client, locations[0]['id']
+
+
+def invalidate_square_connection(access_token=None):
+    """
+    Drop the cached client and locations of an access token, or of every token
+    :param access_token: Seller access token, None to clear the whole cache
+    """
+    with _lock:
+        if access_token is None:
+            _connections.clear()
+        else:
+            _connections.pop(token_key(access_token), None)
+
+
+def invalidate_on_auth_error(access_token, errors):
+    """
+    Drop the cached client when Square rejects the access token, e.g. revoked or expired tokens
+    :param access_token: Seller access token
+    :param errors: Square errors list
+    """
+    if any(error.get('category') == 'AUTHENTICATION_ERROR' for error in errors or []):
+        invalidate_square_connection(access_token)
@@ -0,0 +1,147 @@
+import asyncio
+import email.utils
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict, defaultdict
+
+import httpx
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_STATIC_SEGMENT = re.compile(r"^[a-z][a-z0-9_\-]*$")
+
+
+def endpoint_key(method, path):
+    """
+    Group calls per endpoint by replacing object IDs in the path, e.g. POST /v2/orders/{id}/pay
+    :param method: HTTP method
+    :param path: API path
+    :return: Endpoint key
+    """
+    segments = [segment if _STATIC_SEGMENT.match(segment) else "{id}"
+                for segment in path.split("?")[0].strip("/").split("/")]
+    return method + " /" + "/".join(segments)
+
+
+def retry_after_seconds(response):
+    """
+    Parse the Retry-After header, seconds or HTTP date
+    :param response: httpx Response
+    :return: Seconds to wait, None if not present
+    """
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff (full jitter) honouring Retry-After, a Retry-After above max_delay is not retried.
+    Non idempotent calls are only retried on 429 and connection failures, Square did not process them.
+    """
+
+    def __init__(self, max_retries=3, base_delay=0.2, max_delay=5.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def delay(self, attempt, response=None, error=None, idempotent=True):
+        """
+        Seconds to wait before retrying
+        :param attempt: Number of retries done so far
+        :param response: httpx Response, None if the call failed
+        :param error: httpx TransportError raised by the call
+        :param idempotent: Whether the call is safe to repeat
+        :return: Seconds to wait, None when the call must not be retried
+        """
+        if attempt >= self.max_retries:
+            return None
+        if error is not None:
+            if not idempotent and not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+                return None
+            return self.backoff(attempt)
+        if response.status_code not in RETRYABLE_STATUS:
+            return None
+        if not idempotent and response.status_code != 429:
+            return None
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            # Retrying before Retry-After only spends attempts, answer right away when it is longer than max_delay
+            return retry_after if retry_after <= self.max_delay else None
+        return self.backoff(attempt)
+
+
+class RetryBudget:
+    """
+    Retry budget per endpoint, retries are capped to a ratio of the calls made to that endpoint,
+    so a failing endpoint can not multiply its own load.
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = defaultdict(lambda: float(min_retries))
+        self.exhausted = defaultdict(int)
+        self.retries = defaultdict(int)
+
+    def record_call(self, endpoint):
+        self._tokens[endpoint] = min(self.max_tokens, self._tokens[endpoint] + self.ratio)
+
+    def try_spend(self, endpoint):
+        """
+        Spend one retry from the endpoint budget
+        :param endpoint: Endpoint key
+        :return: True if the retry is allowed
+        """
+        if self._tokens[endpoint] < 1:
+            self.exhausted[endpoint] += 1
+            return False
+        self._tokens[endpoint] -= 1
+        self.retries[endpoint] += 1
+        return True
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket per access token, throttles calls locally before Square starts returning 429
+    """
+
+    def __init__(self, rate=10.0, burst=20, max_buckets=1024):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    async def acquire(self, access_token):
+        """
+        Wait until the access token has a token available
+        :param access_token: Seller access token
+        """
+        if self.rate <= 0:
+            return
+        key = hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+        # Reserve a token, going negative queues the caller behind earlier waiters
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate) - 1
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        if tokens < 0:
+            wait = -tokens / self.rate
+            self.throttled += 1
+            self.throttled_seconds += wait
+            await asyncio.sleep(wait)
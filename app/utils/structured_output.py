@@ -0,0 +1,249 @@
+import json
+import logging
+import re
+from collections import defaultdict
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# First {, [ or a ( that opens a paren-delimited object like ("Dish": "Paneer", "Price": 30)
+JSON_START = re.compile(r"[\[{]|\((?=\s*[\"'{\[])")
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?$")
+LITERALS = {'null': 'null', 'none': 'null', 'nan': 'null', 'true': 'true', 'false': 'false'}
+# Closing quotes of each opening quote, curly quotes only pair with curly quotes
+QUOTES = {'"': '"', '“': '“”', '”': '“”', "'": "'"}
+ESCAPES = '"\\/bfnrtu'
+
+
+class StructuredOutputError(ValueError):
+    def __init__(self, template_id, text, reason):
+        super().__init__(f"{template_id} output is not valid JSON ({reason}): {text[:200]}")
+        self.template_id = template_id
+        self.text = text
+
+
+def _strip_trailing_comma(out):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ',':
+        out.pop()
+
+
+def extract_json(text):
+    """
+    Extract and repair the first JSON value of LLM output in a single pass.
+    Skips prose and ``` fences, turns paren-delimited objects into objects, single and smart quotes into double
+    quotes, Python literals into JSON ones, quotes bare words, drops trailing commas and invalid escapes, escapes
+    newlines in strings and closes truncated output.
+    :param text: LLM output
+    :return: JSON text, None if there is no JSON value in the output
+    """
+    start = JSON_START.search(text)
+    if start is None:
+        return None
+    out, stack, word = [], [], []
+    closers, escape = None, False
+
+    def flush():
+        if word:
+            token = "".join(word)
+            word.clear()
+            if NUMBER.match(token):
+                out.append(token)
+            else:
+                out.append(LITERALS.get(token.lower()) or json.dumps(token))
+
+    for ch in text[start.start():]:
+        if closers is not None:
+            if escape:
+                out.append('\\' + ch if ch in ESCAPES else ch)
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch in closers:
+                out.append('"')
+                closers = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == '\n':
+                out.append('\\n')
+            elif ch in '\r\t':
+                out.append(' ')
+            else:
+                out.append(ch)
+            continue
+        if ch.isalnum() or ch in '_.+-$':
+            word.append(ch)
+            continue
+        flush()
+        if ch in QUOTES:
+            out.append('"')
+            closers = QUOTES[ch]
+        elif ch in '{(':
+            stack.append('}')
+            out.append('{')
+        elif ch == '[':
+            stack.append(']')
+            out.append('[')
+        elif ch in '}])':
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                break
+        elif ch in ',:' or ch.isspace():
+            out.append(ch)
+    else:
+        # Truncated output
+        flush()
+        if closers is not None:
+            out.append('"')
+        while stack:
+            _strip_trailing_comma(out)
+            out.append(stack.pop())
+    return "".join(out)
+
+
+def _lower_keys(value):
+    if isinstance(value, dict):
+        return {str(key).strip().lower(): _lower_keys(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_lower_keys(item) for item in value]
+    return value
+
+
+def _number(value):
+    if isinstance(value, (int, float)) or value is None:
+        return value
+    match = re.search(r"-?\d+(?:\.\d+)?", str(value))
+    if match is None:
+        return value
+    number = float(match.group())
+    return int(number) if number.is_integer() else number
+
+
+def _require(condition, reason):
+    if not condition:
+        raise ValueError(reason)
+
+
+def _bill_of_materials_line(ingredient):
+    # {name, quantity, unit} of one ingredient of a dish, "2 potato" style strings count as one unit of the ingredient
+    if not isinstance(ingredient, dict):
+        return {'name': str(ingredient), 'quantity': 1, 'unit': ''}
+    return {'name': ingredient.get('name'), 'quantity': _number(ingredient.get('quantity')),
+            'unit': ingredient.get('unit') or ''}
+
+
+def recommend_menu_schema(data):
+    # {course: {dish name: {price, customization, ingredients}}}, course and dish names keep their case
+    _require(isinstance(data, dict) and data, "expected an object of courses")
+    menu = {}
+    for course, dishes in data.items():
+        _require(isinstance(dishes, dict), f"expected an object of dishes for {course}")
+        menu[course] = {}
+        for dish, details in dishes.items():
+            details = _lower_keys(details) if isinstance(details, dict) else {'price': details}
+            details['price'] = _number(details.get('price'))
+            customization = details.get('customization')
+            if isinstance(customization, str):
+                details['customization'] = [customization]
+            if 'ingredients' in details:
+                details['ingredients'] = [_bill_of_materials_line(ingredient)
+                                          for ingredient in details['ingredients'] or []]
+            menu[course][dish] = details
+    return menu
+
+
+def ingredient_summary_schema(data):
+    _require(isinstance(data, dict), "expected an object of ingredient types")
+    return data
+
+
+def reengineer_dish_schema(data):
+    if isinstance(data, list) and data:
+        data = data[0]
+    data = _lower_keys(data)
+    _require(isinstance(data, dict) and 'dish' in data, "expected {dish, price}")
+    data['price'] = _number(data.get('price'))
+    return data
+
+
+def order_summary_schema(data):
+    data = _lower_keys(data)
+    if isinstance(data, list):
+        data = {'order': data}
+    _require(isinstance(data, dict) and isinstance(data.get('order'), list), "expected {order: [...]}")
+    for item in data['order']:
+        _require(isinstance(item, dict) and 'name' in item, "expected order items with a name")
+        if item.get('quantity') is not None:
+            item['quantity'] = _number(item['quantity'])
+        money = item.get('base_price_money')
+        if isinstance(money, dict):
+            money['amount'] = _number(money.get('amount'))
+            if isinstance(money.get('currency'), str):
+                money['currency'] = money['currency'].upper()
+    return data
+
+
+SCHEMAS = {
+    'recommend_menu': recommend_menu_schema,
+    'get_ingredient_summary': ingredient_summary_schema,
+    'reengineer_dish': reengineer_dish_schema,
+    'order_summarization': order_summary_schema,
+}
+
+
+class StructuredOutput:
+    """
+    Parses LLM output into JSON validated by the schema of its template, counting clean parses, repairs and failures
+    """
+
+    def __init__(self, schemas):
+        self.schemas = schemas
+        self.counters = defaultdict(lambda: defaultdict(int))
+
+    def parse(self, template_id, text):
+        """
+        Parse LLM output
+        :param template_id: Prompt template name, selects the schema
+        :param text: LLM output
+        :return: Validated JSON value
+        :raises StructuredOutputError: If no JSON value can be recovered or it does not match the schema
+        """
+        counters = self.counters[template_id]
+        text = str(text)
+        try:
+            data = json.loads(text)
+            outcome = 'parsed'
+        except ValueError:
+            repaired = extract_json(text)
+            try:
+                data = json.loads(repaired) if repaired is not None else None
+            except ValueError as e:
+                counters['failed'] += 1
+                raise StructuredOutputError(template_id, text, str(e))
+            if data is None:
+                counters['failed'] += 1
+                raise StructuredOutputError(template_id, text, "no JSON found")
+            outcome = 'repaired'
+        schema = self.schemas.get(template_id)
+        if schema is not None:
+            try:
+                data = schema(data)
+            except ValueError as e:
+                counters['invalid'] += 1
+                raise StructuredOutputError(template_id, text, str(e))
+        counters[outcome] += 1
+        return data
+
+    def parser(self, template_id):
+        return lambda text: self.parse(template_id, text)
+
+    def metrics(self):
+        return {template_id: dict(counters) for template_id, counters in self.counters.items()}
+
+
+structured_output = StructuredOutput(SCHEMAS)
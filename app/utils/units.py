@@ -0,0 +1,129 @@
+import logging
+from collections import Counter
+
+import numpy as np
+
+# logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class UnitRegistry:
+    """
+    Free-text units of the Ingredients table mapped to a canonical base unit (g, ml or pcs) and a factor.
+    Aliases are normalized once at registration; conversions look up each distinct unit of a column once and
+    scale the whole quantity column in one array operation.
+    """
+
+    def __init__(self):
+        self._units = {}
+        self._display = {}
+
+    @staticmethod
+    def normalize(unit):
+        return str(unit or "").strip().lower().rstrip(".")
+
+    def register(self, base, factor, *aliases):
+        """
+        Register aliases of a unit
+        :param base: Base unit, e.g. g
+        :param factor: Base units per unit, e.g. 1000 for kg
+        :param aliases: e.g. kg, kgs, kilogram
+        """
+        for alias in aliases:
+            self._units[self.normalize(alias)] = (base, float(factor))
+
+    def register_display(self, base, unit, factor):
+        """
+        Show totals of a base unit in a larger unit once they reach its factor, e.g. g as kg from 1000 g
+        """
+        self._display[base] = (unit, float(factor))
+
+    def lookup(self, unit):
+        """
+        :param unit: e.g. "Kg"
+        :return: (base unit, factor), None for unknown units
+        """
+        return self._units.get(self.normalize(unit))
+
+    def convert(self, quantities, units):
+        """
+        Convert a column of quantities to base units
+        :param quantities: Quantities, None and unparseable values count as 0
+        :param units: Units of the quantities
+        :return: (base quantities float array, base units object array, known bool array);
+                 unknown units keep their quantity and normalized unit
+        """
+        values = _to_floats(quantities)
+        if not len(values):
+            return values, np.empty(0, dtype=object), np.zeros(0, dtype=bool)
+        if isinstance(units, np.ndarray) and units.dtype.kind == 'U':
+            raw = units
+        else:
+            raw = np.asarray(["" if unit is None else unit for unit in units], dtype=str)
+        distinct, inverse = np.unique(raw, return_inverse=True)
+        names = [self.normalize(unit) for unit in distinct]
+        resolved = [self._units.get(name) for name in names]
+        factors = np.asarray([entry[1] if entry else 1.0 for entry in resolved])
+        bases = np.asarray([entry[0] if entry else name for entry, name in zip(resolved, names)], dtype=object)
+        known = np.asarray([entry is not None for entry in resolved])
+        return values * factors[inverse], bases[inverse], known[inverse]
+
+    def display(self, quantity, base):
+        """
+        Quantity in the unit it reads best in
+        :return: (quantity rounded to 3 decimals, unit), e.g. (1.5, "kg") for 1500 g
+        """
+        unit, factor = self._display.get(base, (base, 1.0))
+        if abs(quantity) < factor:
+            unit, factor = base, 1.0
+        quantity = round(quantity / factor, 3)
+        return (int(quantity) if quantity.is_integer() else quantity), unit
+
+    def unknown(self, ingredients):
+        """
+        Units of ingredients that are not registered
+        :param ingredients: Ingredient mappings with name and unit
+        :return: [{unit, count, ingredients}], most frequent first
+        """
+        counts, names = Counter(), {}
+        for ingredient in ingredients:
+            unit = self.normalize(ingredient.get('unit'))
+            if unit not in self._units:
+                counts[unit] += 1
+                names.setdefault(unit, []).append(ingredient.get('name'))
+        return [{'unit': unit, 'count': count, 'ingredients': names[unit]} for unit, count in counts.most_common()]
+
+
+def _to_float(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_floats(quantities):
+    try:
+        values = np.asarray(quantities, dtype=float)
+        if values.ndim == 1 and not np.isnan(values).any():
+            return values
+    except (TypeError, ValueError):
+        pass
+    return np.asarray([_to_float(quantity) for quantity in quantities], dtype=float)
+
+
+unit_registry = UnitRegistry()
+unit_registry.register('g', 0.001, 'mg', 'milligram', 'milligrams')
+unit_registry.register('g', 1, 'g', 'gm', 'gms', 'gr', 'gram', 'grams', 'gramme', 'grammes')
+unit_registry.register('g', 1000, 'kg', 'kgs', 'kilo', 'kilos', 'kilogram', 'kilograms')
+unit_registry.register('g', 28.3495, 'oz', 'ounce', 'ounces')
+unit_registry.register('g', 453.592, 'lb', 'lbs', 'pound', 'pounds')
+unit_registry.register('ml', 1, 'ml', 'mls', 'millilitre', 'millilitres', 'milliliter', 'milliliters')
+unit_registry.register('ml', 1000, 'l', 'ltr', 'ltrs', 'litre', 'litres', 'liter', 'liters')
+unit_registry.register('ml', 5, 'tsp', 'teaspoon', 'teaspoons')
+unit_registry.register('ml', 15, 'tbsp', 'tablespoon', 'tablespoons')
+unit_registry.register('ml', 240, 'cup', 'cups')
+unit_registry.register('pcs', 1, '', 'pc', 'pcs', 'piece', 'pieces', 'unit', 'units', 'each', 'nos', 'no')
+unit_registry.register('pcs', 12, 'dozen', 'dozens')
+unit_registry.register_display('g', 'kg', 1000)
+unit_registry.register_display('ml', 'l', 1000)
@@ -30,7 +30,7 @@ function SummaryModal({ isOpen, onClose, summary, summaryData }) {
                         {dish.name}{" "}
                       </Text>
                       <Text as="span" key={_index}>
-                        {dish.quantity}
+                        {dish.quantity} {dish.unit}
                       </Text>
                     </Box>
                   );
@@ -21,6 +21,7 @@ function capitalizeFirstLetter(string) {
 }
 const Chat = () => {
   const [history, setHistory] = useState("");
+  const [sessionId, setSessionId] = useState(null);
   const [message, setMessage] = useState("");
   const [chats, setChats] = useState([]);
   const [isModalOpen, setIsModalOpen] = useState(false);
@@ -50,7 +51,11 @@ const Chat = () => {
 
       const response = await backendAPIInstance.post(
         "/customer/chat",
-        { message: stop ? "stop" : message, history },
+        {
+          message: stop ? "stop" : message,
+          history,
+          ...(sessionId && { session_id: sessionId }),
+        },
         {
           headers: {
             "access-token": token,
@@ -59,6 +64,7 @@ const Chat = () => {
       );
       newChats[newChats.length - 1].agent = response.data.response;
       setHistory(JSON.stringify(response.data.history[1]));
+      setSessionId(response.data.session_id);
       setChats(newChats);
       setMessage("");
     } catch (error) {
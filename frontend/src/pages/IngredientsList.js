@@ -29,7 +29,7 @@ const IngredientsList = () => {
   const fetchIngredients = async () => {
     try {
       const response = await backendAPIInstance.post("/ingredients/read");
-      setIngredients(JSON.parse(response.data));
+      setIngredients(response.data);
     } catch (error) {
       console.log("error in fetching ingredients -->", error);
     }
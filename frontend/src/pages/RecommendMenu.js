@@ -79,11 +79,12 @@ const RecommendMenu = () => {
               const newItem = {
                 name: `${dishName} ${item}`,
                 price: dish.price,
+                unpriced: dish.unpriced,
               };
               arr.push(newItem);
             });
           } else {
-            const newItem = { name: dishName, price: dish.price };
+            const newItem = { name: dishName, price: dish.price, unpriced: dish.unpriced };
             arr.push(newItem);
           }
         }
@@ -297,7 +298,9 @@ const RecommendMenu = () => {
                 {category.items.map((item, _index) => (
                   <Box key={_index}>
                     <Text>{item.name}</Text>
-                    <Text>Price: {item.price}</Text>
+                    <Text>
+                      Price: {item.price ?? `unpriced, ${item.unpriced}`}
+                    </Text>
                     <Button
                       size="xs"
                       colorScheme="teal"
@@ -309,6 +312,7 @@ const RecommendMenu = () => {
                     <Button
                       size="xs"
                       colorScheme="pink"
+                      isDisabled={item.price == null}
                       onClick={() => {
                         addToCatalog(item.name, item.price);
                       }}
@@ -0,0 +1,10 @@
+-- Indexes for the ingredient query layer (app/utils/ingredient_repository.py)
+-- Run outside a transaction, e.g. psql "$DATABASE_URL" -f migrations/001_ingredient_indexes.sql
+
+-- Delete and update by name, name prefix search (text_pattern_ops serves both = and LIKE 'prefix%')
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ingredients_ingredient_name_idx
+    ON "Ingredients" (ingredient_name text_pattern_ops);
+
+-- Type and sub type filters
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ingredients_ingredient_type_idx
+    ON "Ingredients" (ingredient_type, ingredient_sub_type);